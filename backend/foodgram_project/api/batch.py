@@ -0,0 +1,137 @@
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import F
+
+from .caching import bump_content_version
+from .serializers import RecipeBatchItemSerializer
+from recipes.models import (Ingredient, IngredientsPerRecipe, Recipe, Tag,
+                            TagsOnRecipe)
+from recipes.search import update_search_index
+from recipes.tasks import schedule_image_variants
+from users.models import CustomUser
+
+
+def digits(values):
+    return {int(value) for value in values if str(value).isdigit()}
+
+
+def as_list(value):
+    return value if isinstance(value, list) else []
+
+
+def referenced_ids(items):
+    """id рецептов, тегов и ингредиентов, упомянутые в пакете."""
+    recipes, tags, ingredients = [], [], []
+    for item in items:
+        if isinstance(item, dict):
+            recipes.append(item.get('id'))
+            tags.extend(as_list(item.get('tags')))
+            ingredients.extend(
+                data.get('id') for data in as_list(item.get('ingredients'))
+                if isinstance(data, dict)
+            )
+    return digits(recipes), digits(tags), digits(ingredients)
+
+
+def check_item(item, instances, user):
+    """Находит изменяемый рецепт и проверяет права на него."""
+    if not isinstance(item, dict):
+        return None, {'non_field_errors': ['Ожидался объект рецепта.']}
+    if 'id' not in item:
+        return None, None
+    instance = instances.get(
+        int(item['id']) if str(item['id']).isdigit() else None
+    )
+    if instance is None:
+        return None, {'id': ['Рецепт не найден.']}
+    if instance.author_id != user.id and not user.is_superuser:
+        return None, {'id': ['Можно изменять только свои рецепты.']}
+    return instance, None
+
+
+@transaction.atomic
+def create_recipes(validated):
+    """Создаёт рецепты вместе с тегами и ингредиентами пачкой.
+
+    bulk_create не отправляет сигналы, поэтому копии картинок, поисковый
+    индекс и счётчики рецептов обновляются здесь. Если база не возвращает id из
+    bulk_create (SQLite), рецепты сохраняются по одному через save.
+    """
+    recipes, tags, amounts = [], [], []
+    for data in validated:
+        data.pop('ingredients', None)
+        tags.append(data.pop('tags'))
+        amounts.append(data.pop('ingredient_amounts'))
+        recipes.append(Recipe(**data))
+    if connection.features.can_return_ids_from_bulk_insert:
+        Recipe.objects.bulk_create(recipes)
+        schedule_image_variants(recipes)
+        Recipe.objects.bulk_update(recipes, ['image_width'])
+        update_search_index(recipe.id for recipe in recipes)
+        authors = Counter(recipe.author_id for recipe in recipes)
+        for author_id, count in authors.items():
+            CustomUser.objects.filter(id=author_id).update(
+                recipes_count=F('recipes_count') + count
+            )
+    else:
+        for recipe in recipes:
+            recipe.save()
+    IngredientsPerRecipe.objects.bulk_create(
+        IngredientsPerRecipe(
+            recipe=recipe, ingredient_id=ingredient_id, amount=amount
+        )
+        for recipe, recipe_amounts in zip(recipes, amounts)
+        for ingredient_id, amount in recipe_amounts.items()
+    )
+    TagsOnRecipe.objects.bulk_create(
+        TagsOnRecipe(recipe=recipe, tag_id=tag_id)
+        for recipe, recipe_tags in zip(recipes, tags)
+        for tag_id in set(recipe_tags)
+    )
+    bump_content_version('recipes')
+    return recipes
+
+
+def save_recipe_batch(items, request):
+    """Создаёт и изменяет рецепты из списка, ошибки - по каждому элементу.
+
+    Элементы с id изменяются через RecipePostSerializer.update, новые
+    рецепты вставляются одной пачкой. Результат - список того же размера
+    с id рецепта или ошибками валидации.
+    """
+    recipe_ids, tag_ids, ingredient_ids = referenced_ids(items)
+    instances = Recipe.objects.in_bulk(recipe_ids)
+    context = {
+        'request': request,
+        'tag_ids': set(Tag.objects.filter(
+            id__in=tag_ids
+        ).values_list('id', flat=True)),
+        'ingredient_ids': set(Ingredient.objects.filter(
+            id__in=ingredient_ids
+        ).values_list('id', flat=True)),
+    }
+    results = []
+    pending = []
+    for item in items:
+        instance, errors = check_item(item, instances, request.user)
+        serializer = None
+        if errors is None:
+            serializer = RecipeBatchItemSerializer(
+                instance, data=item, partial=instance is not None,
+                context=context
+            )
+            if not serializer.is_valid():
+                errors = serializer.errors
+        if errors is not None:
+            results.append({'errors': errors})
+        elif instance is not None:
+            serializer.save()
+            results.append({'id': instance.id})
+        else:
+            pending.append((len(results), serializer.validated_data))
+            results.append(None)
+    recipes = create_recipes([data for _, data in pending]) if pending else []
+    for (position, _), recipe in zip(pending, recipes):
+        results[position] = {'id': recipe.id}
+    return results
@@ -0,0 +1,152 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils.http import urlencode
+from rest_framework.response import Response
+
+from .models import CacheVersion
+
+
+def get_versions(keys):
+    """Версии для нескольких ключей за один запрос к базе.
+
+    Новый счётчик начинается со времени в наносекундах, чтобы после
+    удаления строки версия не совпала с одной из прежних.
+    """
+    versions = dict(CacheVersion.objects.filter(
+        key__in=keys
+    ).values_list('key', 'version'))
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        CacheVersion.objects.bulk_create([
+            CacheVersion(key=key, version=time.time_ns()) for key in missing
+        ], ignore_conflicts=True)
+        versions.update(CacheVersion.objects.filter(
+            key__in=missing
+        ).values_list('key', 'version'))
+    return versions
+
+
+def get_version(key):
+    return get_versions([key])[key]
+
+
+def bump_versions(keys):
+    """Повышает версии после фиксации текущей транзакции.
+
+    Иначе UPDATE держит блокировку общей строки версии до конца
+    транзакции, а при откате кэш сбрасывается впустую.
+    """
+    keys = list(keys)
+    transaction.on_commit(lambda: CacheVersion.objects.filter(
+        key__in=keys
+    ).update(version=F('version') + 1))
+
+
+def bump_version(key):
+    bump_versions([key])
+
+
+def content_version_key(scope):
+    return f'content:version:{scope}'
+
+
+def bump_content_version(*scopes):
+    bump_versions([content_version_key(scope) for scope in scopes])
+
+
+def recipe_version_key(recipe_id):
+    return f'recipe:version:{recipe_id}'
+
+
+def user_version_key(user_id):
+    return f'user:version:{user_id}'
+
+
+def bump_recipe_versions(*recipe_ids):
+    bump_versions([recipe_version_key(recipe_id) for recipe_id in recipe_ids])
+
+
+def get_recipe_documents(recipes, render, host=''):
+    """Общие для всех пользователей представления рецептов из кэша.
+
+    Ключ документа содержит хост запроса (ссылки на картинки абсолютные)
+    и версии рецепта, его автора, тегов и ингредиентов. render
+    вызывается один раз для всех промахов.
+    """
+    scope_keys = [
+        content_version_key('tags'), content_version_key('ingredients')
+    ]
+    version_keys = set(scope_keys)
+    for recipe in recipes:
+        version_keys.add(recipe_version_key(recipe.id))
+        version_keys.add(user_version_key(recipe.author_id))
+    versions = get_versions(list(version_keys))
+    scope = ':'.join(str(versions[key]) for key in scope_keys)
+    keys = [
+        f'recipe:document:{host}:{recipe.id}'
+        f':{versions[recipe_version_key(recipe.id)]}'
+        f':{versions[user_version_key(recipe.author_id)]}:{scope}'
+        for recipe in recipes
+    ]
+    documents = cache.get_many(keys)
+    missing = [
+        (key, recipe) for key, recipe in zip(keys, recipes)
+        if key not in documents
+    ]
+    if missing:
+        rendered = dict(zip(
+            (key for key, _ in missing),
+            render([recipe for _, recipe in missing])
+        ))
+        cache.set_many(rendered, settings.RECIPE_DOCUMENT_TIMEOUT)
+        documents.update(rendered)
+    return [documents[key] for key in keys]
+
+
+def scope_versions(scopes):
+    keys = [content_version_key(scope) for scope in scopes]
+    versions = get_versions(keys)
+    return ':'.join(str(versions[key]) for key in keys)
+
+
+def request_digest(request):
+    """Хэш хоста, пути и нормализованной строки запроса."""
+    query = urlencode(sorted(
+        (key, sorted(values)) for key, values in request.query_params.lists()
+    ), doseq=True)
+    return hashlib.md5(
+        f'{request.get_host()}{request.path}?{query}'.encode()
+    ).hexdigest()
+
+
+class AnonymousListCacheMixin:
+    """Кэширует ответы list для анонимных пользователей.
+
+    Ключ строится из пути, нормализованной строки запроса и версий
+    содержимого из cache_scopes, которые повышаются при любой записи.
+    """
+    cache_scopes = ()
+
+    def get_list_cache_key(self, request):
+        versions = scope_versions(self.cache_scopes)
+        digest = request_digest(request)
+        return f'api:list:{self.cache_scopes[0]}:{versions}:{digest}'
+
+    def list(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+        key = self.get_list_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+        response = super().list(request, *args, **kwargs)
+        cache.set(
+            key, response.data,
+            settings.API_CACHE_TIMEOUTS[self.cache_scopes[0]]
+        )
+        return response
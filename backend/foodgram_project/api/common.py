@@ -1,13 +1,163 @@
-import base64
+import binascii
+import re
+from tempfile import SpooledTemporaryFile
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files import File
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image
 from rest_framework import serializers
 
+from recipes.images import variant_name, variant_widths
+
+DATA_URI_MARKER = ';base64,'
+NOT_BASE64 = re.compile(r'[^A-Za-z0-9+/=]')
+SIGNATURE_SIZE = 12
+IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+
+
+def image_extension(header):
+    """Расширение по сигнатуре первых байтов файла."""
+    for signature, extension in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return extension
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
 
 class Base64ImageField(serializers.ImageField):
+    """Картинка в виде data URI или загруженного файла.
+
+    data URI декодируется по частям во временный файл, который остаётся
+    в памяти только до IMAGE_SPOOL_MAX_SIZE байт. Размер проверяется до
+    декодирования, формат - по сигнатуре первых байтов, размеры в
+    пикселях - по заголовку файла до проверки самой картинки.
+    """
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
-        return super().to_internal_value(data)
+            data = self.decode(data)
+        elif isinstance(data, UploadedFile):
+            data = self.check_upload(data)
+        else:
+            return super().to_internal_value(data)
+        # Картинка уже проверена, проверка ImageField скопировала бы
+        # весь файл в память ещё раз.
+        return serializers.FileField.to_internal_value(self, data)
+
+    def check_size(self, size):
+        if size > settings.IMAGE_UPLOAD_MAX_BYTES:
+            limit = settings.IMAGE_UPLOAD_MAX_BYTES // 2 ** 20
+            raise serializers.ValidationError(
+                f'Размер картинки не должен превышать {limit} МБ.'
+            )
+
+    def check_upload(self, upload):
+        self.check_size(upload.size)
+        upload.seek(0)
+        extension = image_extension(upload.read(SIGNATURE_SIZE))
+        if extension is None:
+            self.fail('invalid_image')
+        upload.seek(0)
+        self.check_image(upload)
+        upload.name = f'temp.{extension}'
+        return upload
+
+    def decode(self, data):
+        start = data.find(DATA_URI_MARKER, 0, 100)
+        if start == -1:
+            self.fail('invalid_image')
+        start += len(DATA_URI_MARKER)
+        self.check_size((len(data) - start) * 3 // 4)
+        output = SpooledTemporaryFile(max_size=settings.IMAGE_SPOOL_MAX_SIZE)
+        try:
+            extension = self.write_decoded(data, start, output)
+            self.check_image(output)
+        except serializers.ValidationError:
+            output.close()
+            raise
+        image = File(output, name=f'temp.{extension}')
+        image.size = output.tell()
+        output.seek(0)
+        return image
+
+    def write_decoded(self, data, start, output):
+        """Декодирует base64 кусками, не собирая картинку целиком.
+
+        Переносы строк и прочие символы вне алфавита выбрасываются, а
+        хвост, не кратный четырём символам, переходит в следующий кусок.
+        """
+        extension = None
+        rest = ''
+        chunk_size = settings.IMAGE_DECODE_CHUNK_SIZE
+        try:
+            for offset in range(start, len(data), chunk_size):
+                text = rest + NOT_BASE64.sub(
+                    '', data[offset:offset + chunk_size]
+                )
+                end = len(text) - len(text) % 4
+                rest = text[end:]
+                output.write(binascii.a2b_base64(text[:end]))
+                if extension is None and output.tell() >= SIGNATURE_SIZE:
+                    extension = self.written_extension(output)
+            output.write(binascii.a2b_base64(rest))
+        except binascii.Error:
+            self.fail('invalid_image')
+        if extension is None:
+            extension = self.written_extension(output)
+        return extension
+
+    def written_extension(self, output):
+        end = output.tell()
+        output.seek(0)
+        extension = image_extension(output.read(SIGNATURE_SIZE))
+        output.seek(end)
+        if extension is None:
+            self.fail('invalid_image')
+        return extension
+
+    def check_image(self, output):
+        end = output.tell()
+        output.seek(0)
+        try:
+            image = Image.open(output)
+        except Exception:
+            self.fail('invalid_image')
+        width, height = image.size
+        if width * height > settings.IMAGE_MAX_PIXELS:
+            raise serializers.ValidationError(
+                f'Картинка больше {settings.IMAGE_MAX_PIXELS} пикселей.'
+            )
+        try:
+            image.verify()
+        except Exception:
+            self.fail('invalid_image')
+        output.seek(end)
+
+
+class ImageSrcsetField(serializers.Field):
+    """Ссылки на WebP-копии картинки рецепта по их ширине."""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        if not recipe.image:
+            return {}
+        storage = recipe.image.storage
+        request = self.context.get('request')
+        srcset = {}
+        for width in variant_widths(recipe.image_width):
+            url = storage.url(variant_name(recipe.image.name, width))
+            srcset[str(width)] = (
+                request.build_absolute_uri(url) if request else url
+            )
+        return srcset
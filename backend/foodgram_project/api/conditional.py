@@ -0,0 +1,51 @@
+import hashlib
+from functools import partial
+
+from django.utils.cache import get_conditional_response, quote_etag
+
+from .caching import request_digest, scope_versions
+
+
+def make_etag(*parts):
+    return hashlib.md5(':'.join(map(str, parts)).encode()).hexdigest()
+
+
+def conditional_response(request, render, etag=None):
+    """Отвечает 304 по If-None-Match.
+
+    render вызывается только если у клиента нет актуальной версии,
+    поэтому сериализаторы при повторных запросах не запускаются.
+    Last-Modified не отдаётся: данные зависят от версий автора, тегов
+    и ингредиентов, которые не выражаются временем изменения.
+    """
+    etag = etag and quote_etag(etag)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = render()
+        if response.status_code != 200:
+            return response
+    if etag:
+        response['ETag'] = etag
+    return response
+
+
+class ContentETagMixin:
+    """ETag для list и retrieve по версиям содержимого из cache_scopes."""
+    cache_scopes = ()
+
+    def get_content_etag(self, request):
+        return make_etag(
+            scope_versions(self.cache_scopes), request_digest(request)
+        )
+
+    def list(self, request, *args, **kwargs):
+        return conditional_response(
+            request, partial(super().list, request, *args, **kwargs),
+            self.get_content_etag(request)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return conditional_response(
+            request, partial(super().retrieve, request, *args, **kwargs),
+            self.get_content_etag(request)
+        )
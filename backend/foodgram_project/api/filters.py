@@ -0,0 +1,44 @@
+from django.db.models import Exists, OuterRef
+from django_filters import rest_framework as filters
+
+from recipes.models import Favorite, Recipe, ShoppingCart, TagsOnRecipe
+from recipes.search import fuzzy_search_recipes, search_recipes
+
+
+class RecipeFilter(filters.FilterSet):
+    """Фильтры рецептов, которые собираются в один SQL-запрос."""
+    tags = filters.CharFilter(method='filter_tags')
+    author = filters.NumberFilter(field_name='author')
+    is_favorited = filters.BooleanFilter(method='filter_is_favorited')
+    is_in_shopping_cart = filters.BooleanFilter(
+        method='filter_is_in_shopping_cart'
+    )
+    search = filters.CharFilter(method='filter_search')
+
+    class Meta:
+        model = Recipe
+        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+
+    def filter_tags(self, queryset, name, value):
+        return queryset.annotate(has_tags=Exists(TagsOnRecipe.objects.filter(
+            recipe_id=OuterRef('pk'), tag__slug__in=self.data.getlist(name)
+        ))).filter(has_tags=True)
+
+    def filter_user_recipes(self, queryset, model, value):
+        user = self.request.user
+        if not value or not user.is_authenticated:
+            return queryset
+        return queryset.filter(
+            id__in=model.objects.filter(user=user).values('recipe_id')
+        )
+
+    def filter_is_favorited(self, queryset, name, value):
+        return self.filter_user_recipes(queryset, Favorite, value)
+
+    def filter_is_in_shopping_cart(self, queryset, name, value):
+        return self.filter_user_recipes(queryset, ShoppingCart, value)
+
+    def filter_search(self, queryset, name, value):
+        if self.data.get('mode') == 'fuzzy':
+            return fuzzy_search_recipes(queryset, value)
+        return search_recipes(queryset, value)
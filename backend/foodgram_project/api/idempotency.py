@@ -0,0 +1,118 @@
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models.signals import post_delete
+from django.utils import timezone
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyKey
+
+
+def create_once(model, **fields):
+    """Создаёт запись одним INSERT, повтор упирается в уникальность.
+
+    Возвращает созданную запись или None, если такая уже есть.
+    """
+    try:
+        with transaction.atomic():
+            return model.objects.create(**fields)
+    except IntegrityError:
+        return None
+
+
+def delete_rows(model, **values):
+    """Удаляет строки одним DELETE без сигналов и возвращает их число.
+
+    values - пары столбец и значение или список значений.
+    """
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    conditions, params = [], []
+    for column, value in values.items():
+        if isinstance(value, (list, tuple, set, frozenset)):
+            value = list(value)
+            placeholders = ', '.join(['%s'] * len(value))
+            conditions.append(f'{quote(column)} IN ({placeholders})')
+            params.extend(value)
+        else:
+            conditions.append(f'{quote(column)} = %s')
+            params.append(value)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(model._meta.db_table)} '
+            f'WHERE {" AND ".join(conditions)}',
+            params
+        )
+        return cursor.rowcount
+
+
+def delete_once(model, **fields):
+    """Удаляет запись одним DELETE и сообщает, была ли она удалена.
+
+    post_delete отправляется, только если строку удалил именно этот
+    запрос, поэтому параллельные удаления не уменьшают счётчики дважды.
+    QuerySet.delete для этого не подходит: он шлёт сигналы для всех
+    найденных записей, даже если их уже удалил другой запрос.
+    """
+    instance = model.objects.filter(**fields).first()
+    if instance is None:
+        return False
+    if not delete_rows(model, **{model._meta.pk.column: instance.pk}):
+        return False
+    post_delete.send(
+        sender=model, instance=instance, using=router.db_for_write(model)
+    )
+    return True
+
+
+def request_key(request, header):
+    """Ключ из пользователя, метода, пути, заголовка и тела запроса.
+
+    Тело входит в ключ, поэтому тот же заголовок с другими данными
+    считается новым запросом.
+    """
+    body = json.dumps(request.data, sort_keys=True, cls=JSONEncoder)
+    return hashlib.sha256(
+        f'{request.user.id}:{request.method}:{request.path}:{header}:{body}'
+        .encode()
+    ).hexdigest()
+
+
+def idempotent(handler):
+    """Повторяет сохранённый ответ для запроса с тем же Idempotency-Key.
+
+    Ответы хранятся в таблице IdempotencyKey, общей для всех процессов,
+    IDEMPOTENCY_KEY_TIMEOUT секунд.
+    """
+    @wraps(handler)
+    def wrapper(self, request, *args, **kwargs):
+        header = request.META.get('HTTP_IDEMPOTENCY_KEY')
+        if not header:
+            return handler(self, request, *args, **kwargs)
+        key = request_key(request, header)
+        deadline = timezone.now() - timedelta(
+            seconds=settings.IDEMPOTENCY_KEY_TIMEOUT
+        )
+        stored = IdempotencyKey.objects.filter(
+            key=key, created_at__gte=deadline
+        ).first()
+        if stored is not None:
+            response = Response(
+                json.loads(stored.data), status=stored.status_code
+            )
+            response['Idempotent-Replayed'] = 'true'
+            return response
+        response = handler(self, request, *args, **kwargs)
+        if response.status_code < 500:
+            IdempotencyKey.objects.filter(created_at__lt=deadline).delete()
+            create_once(
+                IdempotencyKey, key=key, status_code=response.status_code,
+                data=json.dumps(response.data, cls=JSONEncoder)
+            )
+        return response
+    return wrapper
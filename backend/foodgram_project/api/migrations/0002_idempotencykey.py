@@ -0,0 +1,23 @@
+# Generated by Django 2.2.16 on 2026-10-18 20:15
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='Ключ')),
+                ('status_code', models.PositiveSmallIntegerField(verbose_name='Код ответа')),
+                ('data', models.TextField(verbose_name='Тело ответа в JSON')),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Дата создания')),
+            ],
+        ),
+    ]
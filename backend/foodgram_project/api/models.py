@@ -0,0 +1,33 @@
+from django.db import models
+from django.utils import timezone
+
+
+class CacheVersion(models.Model):
+    """Версия закэшированных данных, общая для всех процессов.
+
+    Сами данные лежат в кэше процесса, а ключ кэша содержит версию, так
+    что изменение в любом процессе, в том числе в воркере очереди,
+    видно всем остальным.
+    """
+    key = models.CharField('Ключ', max_length=100, primary_key=True)
+    version = models.BigIntegerField('Версия')
+
+    def __str__(self):
+        return f'{self.key}: {self.version}'
+
+
+class IdempotencyKey(models.Model):
+    """Сохранённый ответ на запрос с заголовком Idempotency-Key.
+
+    Хранится в базе, чтобы повтор, попавший в другой процесс, получил
+    тот же ответ.
+    """
+    key = models.CharField('Ключ', max_length=64, primary_key=True)
+    status_code = models.PositiveSmallIntegerField('Код ответа')
+    data = models.TextField('Тело ответа в JSON')
+    created_at = models.DateTimeField(
+        'Дата создания', default=timezone.now, db_index=True
+    )
+
+    def __str__(self):
+        return self.key
@@ -0,0 +1,20 @@
+import mimetypes
+
+from rest_framework.parsers import FileUploadParser
+
+
+class RawImageParser(FileUploadParser):
+    """Тело запроса - сама картинка, имя файла необязательно.
+
+    Как и FileUploadParser, пишет тело через обработчики загрузки
+    Django, поэтому большие файлы сразу попадают на диск.
+    """
+    media_type = 'image/*'
+
+    def get_filename(self, stream, media_type, parser_context):
+        filename = super().get_filename(stream, media_type, parser_context)
+        if filename:
+            return filename
+        content_type = parser_context['request'].content_type
+        extension = mimetypes.guess_extension(content_type.split(';')[0])
+        return f'upload{extension or ""}'
@@ -0,0 +1,50 @@
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .caching import bump_version, get_version
+from recipes.models import Favorite, ShoppingCart
+from users.models import Follow
+
+UserRelations = namedtuple(
+    'UserRelations', ('favorites', 'shopping_cart', 'following')
+)
+NO_RELATIONS = UserRelations(frozenset(), frozenset(), frozenset())
+
+
+def version_key(user_id):
+    return f'relations:version:{user_id}'
+
+
+def invalidate_relations(user_id):
+    bump_version(version_key(user_id))
+
+
+def get_relations(user):
+    """Множества id избранного, корзины и подписок пользователя."""
+    if not user or not user.is_authenticated:
+        return NO_RELATIONS
+    key = f'relations:{user.id}:{get_version(version_key(user.id))}'
+    relations = cache.get(key)
+    if relations is None:
+        relations = UserRelations(
+            frozenset(Favorite.objects.filter(
+                user=user
+            ).values_list('recipe_id', flat=True)),
+            frozenset(ShoppingCart.objects.filter(
+                user=user
+            ).values_list('recipe_id', flat=True)),
+            frozenset(Follow.objects.filter(
+                user=user
+            ).exclude(author=user).values_list('author_id', flat=True)),
+        )
+        cache.set(key, relations, settings.RELATIONS_CACHE_TIMEOUT)
+    return relations
+
+
+def context_relations(context):
+    """Связи пользователя запроса, загруженные один раз на контекст."""
+    if 'relations' not in context:
+        context['relations'] = get_relations(context.get('request_user'))
+    return context['relations']
@@ -1,8 +1,14 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Manager, Prefetch, prefetch_related_objects
 from rest_framework import serializers
 
-from .common import Base64ImageField
-from recipes.models import (Favorite, Ingredient, IngredientsPerRecipe, Recipe,
-                            ShoppingCart, Tag)
+from .caching import get_recipe_documents
+from .common import Base64ImageField, ImageSrcsetField
+from .relations import context_relations
+from recipes.models import (MAX_VALUE, MIN_VALUE, Ingredient,
+                            IngredientsPerRecipe, Recipe, Tag)
+from recipes.shopping_list import change_amounts
 from users.serializers import AuthorSerializer
 
 
@@ -26,6 +32,19 @@ class IngredientSerializer(serializers.ModelSerializer):
         return ret
 
 
+class IngredientAmountSerializer(serializers.ModelSerializer):
+    """Сериализатор ингредиента рецепта вместе с его количеством."""
+    id = serializers.ReadOnlyField(source='ingredient.id')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit'
+    )
+
+    class Meta:
+        fields = ('id', 'name', 'measurement_unit', 'amount')
+        model = IngredientsPerRecipe
+
+
 class TagSerializer(serializers.ModelSerializer):
     """Сериализатор для модели Tag."""
 
@@ -34,42 +53,89 @@ class TagSerializer(serializers.ModelSerializer):
         model = Tag
 
 
+RECIPE_PREFETCH = (
+    'tags',
+    Prefetch(
+        'ingredientsperrecipe_set',
+        queryset=IngredientsPerRecipe.objects.filter(
+            ingredient__isnull=False
+        ).select_related('ingredient').order_by('ingredient__name')
+    ),
+)
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        if isinstance(data, Manager):
+            data = data.all()
+        return self.child.cached_representations(list(data))
+
+
 class RecipeGetSerializer(serializers.ModelSerializer):
     """Сериализатор для получения экземпляра модели Recipe."""
     id = serializers.IntegerField()
     tags = TagSerializer(read_only=True, many=True)
     author = AuthorSerializer()
-    ingredients = IngredientSerializer(
-        read_only=True, many=True,
+    ingredients = IngredientAmountSerializer(
+        source='ingredientsperrecipe_set', read_only=True, many=True,
     )
     image = Base64ImageField()
+    image_srcset = ImageSrcsetField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
     class Meta:
         fields = (
             'id', 'tags', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time'
+            'is_in_shopping_cart', 'name', 'image', 'image_srcset', 'text',
+            'cooking_time'
         )
         model = Recipe
+        list_serializer_class = RecipeListSerializer
 
     def get_is_favorited(self, obj):
-        if self.context['request_user'].is_authenticated:
-            return Favorite.objects.filter(
-                recipe_id=obj.id, user=self.context['request_user']
-            ).exists()
-        return False
+        return obj.id in context_relations(self.context).favorites
 
     def get_is_in_shopping_cart(self, obj):
-        if self.context['request_user'].is_authenticated:
-            return ShoppingCart.objects.filter(
-                recipe_id=obj.id, user=self.context['request_user']
-            ).exists()
-        return False
+        return obj.id in context_relations(self.context).shopping_cart
 
-    def to_representation(self, value):
-        self.context['recipe_id'] = value.id
-        return super().to_representation(value)
+    def to_representation(self, instance):
+        return self.cached_representations([instance])[0]
+
+    def render_documents(self, recipes):
+        """Представления рецептов без флагов текущего пользователя."""
+        prefetch_related_objects(recipes, *RECIPE_PREFETCH)
+        documents = []
+        for recipe in recipes:
+            document = super().to_representation(recipe)
+            document['is_favorited'] = False
+            document['is_in_shopping_cart'] = False
+            document['author']['is_subscribed'] = False
+            documents.append(document)
+        return documents
+
+    def cached_representations(self, recipes):
+        """Кэшированные документы рецептов с наложенными флагами."""
+        relations = context_relations(self.context)
+        request = self.context.get('request')
+        host = request.get_host() if request else ''
+        documents = get_recipe_documents(
+            recipes, self.render_documents, host
+        )
+        representations = []
+        for document in documents:
+            data = document.copy()
+            data['author'] = document['author'].copy()
+            data['is_favorited'] = data['id'] in relations.favorites
+            data['is_in_shopping_cart'] = (
+                data['id'] in relations.shopping_cart
+            )
+            data['author']['is_subscribed'] = (
+                data['author']['id'] in relations.following
+            )
+            representations.append(data)
+        return representations
 
 
 class TagPKField(serializers.PrimaryKeyRelatedField):
@@ -101,44 +167,76 @@ class RecipePostSerializer(serializers.ModelSerializer):
         )
         model = Recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
+        validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+        amounts = validated_data.pop('ingredient_amounts', None)
         instance.name = validated_data.get('name', instance.name)
         instance.image = validated_data.get('image', instance.image)
         instance.text = validated_data.get('text', instance.text)
         instance.cooking_time = validated_data.get(
             'cooking_time', instance.cooking_time
         )
-        instance.tags.set(validated_data.get('tags', instance.tags))
-        ing_data = self.initial_data.get('ingredients', instance.ingredients)
-        ing_list = []
-        IngredientsPerRecipe.objects.filter(
-            recipe_id=instance.id,
-        ).delete()
-        for data in ing_data:
-            ing_per_recipe = IngredientsPerRecipe(
-                recipe_id=instance.id,
-                ingredient_id=data['id'],
-                amount=data['amount']
-            )
-            ing_list.append(ing_per_recipe)
-        IngredientsPerRecipe.objects.bulk_create(ing_list)
-        instance.save()
+        if tags is not None:
+            instance.tags.set(tags)
+        if amounts is not None:
+            self.update_ingredients(instance, amounts)
+        # Счётчики меняются отдельными UPDATE, их старые значения из
+        # instance записывать нельзя.
+        instance.save(update_fields=(
+            'name', 'image', 'text', 'cooking_time', 'updated_at'
+        ))
         return instance
 
+    def update_ingredients(self, recipe, amounts):
+        """Удаляет, меняет и добавляет только отличающиеся строки.
+
+        Удаление идёт через сигналы, которые сами правят списки покупок,
+        для bulk_update и bulk_create изменения переносятся явно.
+        """
+        removed = []
+        changed = []
+        changes = {}
+        for row in recipe.ingredientsperrecipe_set.all():
+            amount = amounts.get(row.ingredient_id)
+            if amount is None:
+                removed.append(row.pk)
+            elif amount != row.amount:
+                changes[row.ingredient_id] = amount - row.amount
+                row.amount = amount
+                changed.append(row)
+            changes.setdefault(row.ingredient_id, 0)
+        added = [
+            IngredientsPerRecipe(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in changes
+        ]
+        if removed:
+            IngredientsPerRecipe.objects.filter(pk__in=removed).delete()
+        if changed:
+            IngredientsPerRecipe.objects.bulk_update(changed, ['amount'])
+        if added:
+            IngredientsPerRecipe.objects.bulk_create(added)
+        changes.update((row.ingredient_id, row.amount) for row in added)
+        change_amounts(recipe.id, {
+            ingredient_id: change
+            for ingredient_id, change in changes.items() if change
+        })
+
     def create(self, validated_data):
         tags_data = validated_data.pop('tags')
         validated_data.pop('ingredients')
-        ing_data = self.initial_data.get('ingredients')
+        amounts = validated_data.pop('ingredient_amounts')
         recipe = Recipe.objects.create(**validated_data)
-        ing_list = []
-        for data in ing_data:
-            ing_per_recipe = IngredientsPerRecipe(
-                recipe_id=recipe.id,
-                ingredient_id=data['id'],
-                amount=data['amount']
+        IngredientsPerRecipe.objects.bulk_create(
+            IngredientsPerRecipe(
+                recipe_id=recipe.id, ingredient_id=ingredient_id, amount=amount
             )
-            ing_list.append(ing_per_recipe)
-        IngredientsPerRecipe.objects.bulk_create(ing_list)
+            for ingredient_id, amount in amounts.items()
+        )
         recipe.tags.set(tags_data)
         return recipe
 
@@ -148,8 +246,83 @@ class RecipePostSerializer(serializers.ModelSerializer):
 
     def validate(self, attrs):
         ing_data = self.initial_data.get('ingredients')
-        for data in ing_data:
-            if int(data['amount']) < 1 or int(data['amount']) > 10000:
+        if ing_data is None:
+            if not self.partial:
                 raise serializers.ValidationError(
-                    'Количество должно быть в диапазоне от 1 до 10000!')
+                    {'ingredients': ['Обязательное поле.']}
+                )
+            return attrs
+        attrs['ingredient_amounts'] = self.validate_ingredient_amounts(
+            ing_data
+        )
         return attrs
+
+    def existing_ingredient_ids(self, ids):
+        return set(Ingredient.objects.filter(
+            id__in=ids
+        ).values_list('id', flat=True))
+
+    def validate_ingredient_amounts(self, ing_data):
+        """Проверяет ингредиенты из запроса одним запросом к базе."""
+        try:
+            amounts = {
+                int(data['id']): int(data['amount']) for data in ing_data
+            }
+        except (TypeError, KeyError, ValueError):
+            raise serializers.ValidationError(
+                {'ingredients': ['Укажите id и amount каждого ингредиента.']}
+            )
+        if len(amounts) != len(ing_data):
+            raise serializers.ValidationError(
+                {'ingredients': ['Ингредиенты не должны повторяться!']}
+            )
+        if any(not MIN_VALUE <= amount <= MAX_VALUE
+               for amount in amounts.values()):
+            raise serializers.ValidationError(
+                'Количество должно быть в диапазоне от 1 до 10000!')
+        missing = set(amounts) - self.existing_ingredient_ids(amounts)
+        if missing:
+            ids = ', '.join(map(str, sorted(missing)))
+            raise serializers.ValidationError(
+                {'ingredients': [f'Нет ингредиентов с id: {ids}.']}
+            )
+        return amounts
+
+
+class RecipeImageSerializer(serializers.ModelSerializer):
+    """Картинка рецепта, загруженная отдельно от остальных полей."""
+    image = Base64ImageField()
+    image_srcset = ImageSrcsetField()
+
+    class Meta:
+        model = Recipe
+        fields = ('image', 'image_srcset')
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для массовых операций."""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False,
+        max_length=settings.RECIPE_BATCH_SIZE
+    )
+
+
+class RecipeBatchItemSerializer(RecipePostSerializer):
+    """Рецепт из пакетного запроса.
+
+    Теги и ингредиенты всего пакета загружаются заранее, и ссылки
+    проверяются по множествам tag_ids и ingredient_ids из context.
+    """
+    tags = serializers.ListField(
+        child=serializers.IntegerField(), required=True
+    )
+
+    def validate_tags(self, value):
+        missing = set(value) - self.context['tag_ids']
+        if missing:
+            ids = ', '.join(map(str, sorted(missing)))
+            raise serializers.ValidationError(f'Нет тегов с id: {ids}.')
+        return value
+
+    def existing_ingredient_ids(self, ids):
+        return self.context['ingredient_ids'] & set(ids)
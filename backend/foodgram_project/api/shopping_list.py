@@ -0,0 +1,113 @@
+import csv
+import json
+from decimal import Decimal
+from itertools import groupby
+from operator import itemgetter
+
+from django.db.models import F
+
+from recipes.models import ShoppingListItem
+
+UNIT_CONVERSIONS = {
+    'мг': ('г', Decimal('0.001')),
+    'г': ('г', Decimal(1)),
+    'кг': ('г', Decimal(1000)),
+    'мл': ('мл', Decimal(1)),
+    'л': ('мл', Decimal(1000)),
+}
+DISPLAY_UNITS = {
+    'г': (('кг', Decimal(1000)), ('г', Decimal(1)), ('мг', Decimal('0.001'))),
+    'мл': (('л', Decimal(1000)), ('мл', Decimal(1))),
+}
+
+
+class Echo:
+    """Псевдобуфер, который сразу отдаёт записанную в него строку."""
+
+    def write(self, value):
+        return value
+
+
+def get_cart_ingredients(user):
+    """Список покупок пользователя из заранее посчитанных сумм."""
+    return ShoppingListItem.objects.filter(user=user).values(
+        'ingredient_id', 'ingredient__name', 'ingredient__measurement_unit',
+        total=F('amount')
+    ).order_by('ingredient__name', 'ingredient_id')
+
+
+def display_amount(total, base_unit):
+    """Переводит сумму в самую крупную единицу, где она не меньше 1."""
+    for unit, factor in DISPLAY_UNITS.get(base_unit, ()):
+        if total >= factor:
+            break
+    else:
+        unit, factor = base_unit, Decimal(1)
+    value = total / factor
+    return unit, int(value) if value == value.to_integral() else float(value)
+
+
+def merge_units(ingredients):
+    """Объединяет строки одного ингредиента в разных единицах измерения.
+
+    Строки приходят отсортированными по названию, поэтому группы
+    собираются за один потоковый проход. Единицы из UNIT_CONVERSIONS
+    приводятся к базовой, остальные суммируются как есть.
+    """
+    rows = ingredients.iterator()
+    for name, group in groupby(rows, key=itemgetter('ingredient__name')):
+        totals = {}
+        for item in group:
+            unit = item['ingredient__measurement_unit']
+            base_unit, factor = UNIT_CONVERSIONS.get(unit, (unit, None))
+            if factor is None:
+                totals[base_unit] = totals.get(base_unit, 0) + item['total']
+            else:
+                totals[base_unit] = (
+                    totals.get(base_unit, 0) + item['total'] * factor
+                )
+        for base_unit, total in totals.items():
+            unit, amount = display_amount(total, base_unit)
+            yield {
+                'ingredient__name': name,
+                'ingredient__measurement_unit': unit,
+                'total': amount,
+            }
+
+
+def render_txt(ingredients):
+    for item in ingredients:
+        yield (
+            f'{item["ingredient__name"]} '
+            f'({item["ingredient__measurement_unit"]}) - {item["total"]}\n'
+        )
+
+
+def render_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for item in ingredients:
+        yield writer.writerow((
+            item['ingredient__name'],
+            item['ingredient__measurement_unit'],
+            item['total'],
+        ))
+
+
+def render_json(ingredients):
+    separator = '['
+    for item in ingredients:
+        yield separator + json.dumps({
+            'name': item['ingredient__name'],
+            'measurement_unit': item['ingredient__measurement_unit'],
+            'amount': item['total'],
+        }, ensure_ascii=False)
+        separator = ','
+    yield '[]' if separator == '[' else ']'
+
+
+EXPORT_FORMATS = {
+    'txt': ('text/plain; charset=UTF-8', render_txt),
+    'csv': ('text/csv; charset=UTF-8', render_csv),
+    'json': ('application/json; charset=UTF-8', render_json),
+}
@@ -0,0 +1,92 @@
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+
+from .caching import (bump_content_version, bump_recipe_versions, bump_version,
+                      user_version_key)
+from .relations import invalidate_relations
+from recipes.models import (Favorite, Ingredient, IngredientsPerRecipe, Recipe,
+                            ShoppingCart, Tag, TagsOnRecipe)
+from users.models import CustomUser, Follow
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def relations_changed(sender, instance, **kwargs):
+    invalidate_relations(instance.user_id)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=IngredientsPerRecipe)
+@receiver(post_delete, sender=IngredientsPerRecipe)
+@receiver(post_save, sender=TagsOnRecipe)
+@receiver(post_delete, sender=TagsOnRecipe)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipes_changed(sender, **kwargs):
+    bump_content_version('recipes')
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tags_changed(sender, **kwargs):
+    bump_content_version('tags')
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredients_changed(sender, **kwargs):
+    bump_content_version('ingredients')
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, **kwargs):
+    bump_recipe_versions(instance.id)
+
+
+@receiver(post_save, sender=IngredientsPerRecipe)
+@receiver(post_delete, sender=IngredientsPerRecipe)
+@receiver(post_save, sender=TagsOnRecipe)
+@receiver(post_delete, sender=TagsOnRecipe)
+def recipe_relation_changed(sender, instance, **kwargs):
+    bump_recipe_versions(instance.recipe_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, reverse, pk_set, **kwargs):
+    if reverse:
+        bump_recipe_versions(*(pk_set or ()))
+    else:
+        bump_recipe_versions(instance.id)
+
+
+# Поля пользователя, которые попадают в представление рецепта.
+AUTHOR_FIELDS = ('email', 'username', 'first_name', 'last_name')
+
+
+@receiver(pre_save, sender=CustomUser)
+def user_saving(sender, instance, update_fields=None, **kwargs):
+    instance.saved_author_fields = None
+    if instance.pk and (
+        update_fields is None or set(update_fields) & set(AUTHOR_FIELDS)
+    ):
+        instance.saved_author_fields = CustomUser.objects.filter(
+            pk=instance.pk
+        ).values_list(*AUTHOR_FIELDS).first()
+
+
+@receiver(post_save, sender=CustomUser)
+def user_saved(sender, instance, created, **kwargs):
+    """Сбрасывает кэш рецептов при смене видимых в них полей автора."""
+    saved = getattr(instance, 'saved_author_fields', None)
+    if created or saved is None or saved == tuple(
+        getattr(instance, field) for field in AUTHOR_FIELDS
+    ):
+        return
+    bump_version(user_version_key(instance.id))
+    if Recipe.objects.filter(author_id=instance.id).exists():
+        bump_content_version('recipes')
@@ -0,0 +1,582 @@
+import base64
+import io
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import skipIf
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIClient
+
+from .caching import bump_version, content_version_key, get_version
+from .common import Base64ImageField
+from .serializers import RecipePostSerializer
+from recipes.models import (Favorite, Ingredient, IngredientsPerRecipe, Recipe,
+                            ShoppingCart, ShoppingListItem, Tag, TagsOnRecipe)
+from users.models import CustomUser, Follow
+
+
+def create_user(username):
+    return CustomUser.objects.create_user(
+        email=f'{username}@example.com', username=username, password='pass',
+        first_name='Имя', last_name='Фамилия'
+    )
+
+
+def create_recipe(author, name='Рецепт', **fields):
+    return Recipe.objects.create(
+        author=author, name=name, text=fields.pop('text', 'Текст'),
+        image='images/recipe.png', cooking_time=10, **fields
+    )
+
+
+class RecipeListQueriesTests(TestCase):
+    """Число запросов на страницу не зависит от её размера и состава."""
+    LIST_QUERIES = 6
+    AUTHENTICATED_LIST_QUERIES = 9
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.reader = create_user('reader')
+        cls.tags = Tag.objects.bulk_create(
+            Tag(name=slug, slug=slug) for slug in ('breakfast', 'lunch')
+        )
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {i}', measurement_unit='г')
+            for i in range(10)
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def create_recipes(self, count, ingredients):
+        for number in range(count):
+            recipe = Recipe.objects.create(
+                author=self.author, name=f'Рецепт {number}', text='Текст',
+                image='images/recipe.png', cooking_time=10
+            )
+            IngredientsPerRecipe.objects.bulk_create(
+                IngredientsPerRecipe(
+                    recipe=recipe, ingredient=ingredient, amount=10
+                ) for ingredient in self.ingredients[:ingredients]
+            )
+            TagsOnRecipe.objects.bulk_create(
+                TagsOnRecipe(recipe=recipe, tag=tag) for tag in self.tags
+            )
+            Favorite.objects.create(user=self.reader, recipe=recipe)
+            ShoppingCart.objects.create(user=self.reader, recipe=recipe)
+
+    def assert_list_queries(self, client, expected):
+        # Версии кэша создаются при первом запросе, поэтому он
+        # делается заранее; сами документы рецептов считаются заново.
+        client.get('/api/recipes/?limit=10')
+        for page_size in (2, 10):
+            with self.subTest(page_size=page_size):
+                cache.clear()
+                with self.assertNumQueries(expected):
+                    response = client.get(f'/api/recipes/?limit={page_size}')
+                self.assertEqual(len(response.data['results']), page_size)
+
+    def test_list_queries(self):
+        reader = APIClient()
+        reader.force_authenticate(self.reader)
+        for ingredients in (1, 10):
+            Recipe.objects.all().delete()
+            self.create_recipes(10, ingredients)
+            with self.subTest(ingredients=ingredients, user='anonymous'):
+                self.assert_list_queries(APIClient(), self.LIST_QUERIES)
+            with self.subTest(ingredients=ingredients, user='reader'):
+                self.assert_list_queries(
+                    reader, self.AUTHENTICATED_LIST_QUERIES
+                )
+
+
+class RecipeSearchTests(TestCase):
+    """Полнотекстовый и нечёткий поиск рецептов."""
+
+    def create_recipes(self, *names_and_texts):
+        author = create_user('author')
+        for name, text in names_and_texts:
+            Recipe.objects.create(
+                author=author, name=name, text=text,
+                image='images/recipe.png', cooking_time=10
+            )
+
+    def test_search_keeps_rank(self):
+        self.create_recipes(
+            ('Капуста', 'Капуста тушёная'), ('Щи', 'капуста')
+        )
+        response = APIClient().get('/api/recipes/', {
+            'search': 'капуста', 'pagination': 'cursor', 'limit': 2
+        })
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(
+            [recipe['name'] for recipe in response.data['results']],
+            ['Капуста', 'Щи']
+        )
+
+    def fuzzy_names(self, query):
+        response = APIClient().get('/api/recipes/', {
+            'search': query, 'mode': 'fuzzy', 'limit': 10
+        })
+        return [recipe['name'] for recipe in response.data['results']]
+
+    def test_fuzzy_name(self):
+        self.create_recipes(
+            ('Салат оливье', 'Текст'), ('Оливье', 'Текст'), ('Борщ', 'Текст')
+        )
+        for query, names in (('оливе', ['Оливье']), ('борш', ['Борщ'])):
+            with self.subTest(query=query):
+                self.assertEqual(self.fuzzy_names(query), names)
+        # Порог ниже 0.3 по умолчанию в pg_trgm тоже соблюдается.
+        cache.clear()
+        with override_settings(RECIPE_SIMILARITY_THRESHOLD=0.2):
+            self.assertEqual(
+                self.fuzzy_names('оливе'), ['Оливье', 'Салат оливье']
+            )
+
+
+@skipIf(
+    connection.vendor == 'sqlite',
+    'тестовая база SQLite в памяти блокирует таблицы без ожидания'
+)
+class ConcurrentToggleTests(TransactionTestCase):
+    """Параллельные повторы переключателей оставляют одну строку."""
+    THREADS = 8
+
+    def setUp(self):
+        self.author = create_user('author')
+        self.reader = create_user('reader')
+        self.ingredient = Ingredient.objects.create(
+            name='Мука', measurement_unit='г'
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Текст',
+            image='images/recipe.png', cooking_time=10
+        )
+        IngredientsPerRecipe.objects.create(
+            recipe=self.recipe, ingredient=self.ingredient, amount=100
+        )
+
+    def send(self, barrier, method, path):
+        client = APIClient()
+        client.force_authenticate(self.reader)
+        try:
+            barrier.wait()
+            return getattr(client, method)(path).status_code
+        finally:
+            connections.close_all()
+
+    def send_parallel(self, method, path):
+        barrier = threading.Barrier(self.THREADS)
+        with ThreadPoolExecutor(self.THREADS) as executor:
+            futures = [
+                executor.submit(self.send, barrier, method, path)
+                for _ in range(self.THREADS)
+            ]
+            return {future.result() for future in futures}
+
+    def toggle(self, path, rows, counter):
+        self.assertEqual(self.send_parallel('post', path), {201})
+        self.assertEqual(rows(), 1)
+        self.assertEqual(counter(), 1)
+        self.assertEqual(self.send_parallel('delete', path), {204})
+        self.assertEqual(rows(), 0)
+        self.assertEqual(counter(), 0)
+
+    def test_favorite(self):
+        self.toggle(
+            f'/api/recipes/{self.recipe.id}/favorite/',
+            Favorite.objects.filter(user=self.reader).count,
+            lambda: Recipe.objects.get(id=self.recipe.id).favorites_count
+        )
+
+    def test_shopping_cart(self):
+        def counter():
+            amounts = ShoppingListItem.objects.filter(
+                user=self.reader, ingredient=self.ingredient
+            ).values_list('amount', flat=True)
+            return sum(amounts) // 100
+
+        self.toggle(
+            f'/api/recipes/{self.recipe.id}/shopping_cart/',
+            ShoppingCart.objects.filter(user=self.reader).count, counter
+        )
+
+    def test_follow(self):
+        self.toggle(
+            f'/api/users/{self.author.id}/subscribe/',
+            Follow.objects.filter(user=self.reader).count,
+            lambda: CustomUser.objects.get(id=self.author.id).followers_count
+        )
+
+
+class Base64ImageFieldTests(TestCase):
+    """Картинка декодируется кусками при любой разбивке base64."""
+
+    def setUp(self):
+        output = io.BytesIO()
+        Image.new('RGB', (40, 30), 'red').save(output, 'PNG')
+        self.content = output.getvalue()
+
+    def decode(self, encoded):
+        image = Base64ImageField().to_internal_value(
+            f'data:image/png;base64,{encoded}'
+        )
+        with image:
+            return image.read()
+
+    def test_line_breaks(self):
+        for encode in (base64.encodebytes, base64.b64encode):
+            encoded = encode(self.content).decode().replace('\n', '\r\n')
+            for chunk_size in (7, 8):
+                with self.subTest(
+                    encode=encode.__name__, chunk_size=chunk_size
+                ), override_settings(IMAGE_DECODE_CHUNK_SIZE=chunk_size):
+                    self.assertEqual(self.decode(encoded), self.content)
+
+
+class RecipeBatchTests(TestCase):
+    """Пакетный запрос возвращает результат по каждому элементу."""
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media = override_settings(MEDIA_ROOT=media_root.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.author = create_user('author')
+        self.own = create_recipe(self.author)
+        self.other = create_recipe(create_user('other'))
+        self.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        self.ingredient = Ingredient.objects.create(
+            name='мука', measurement_unit='г'
+        )
+        output = io.BytesIO()
+        Image.new('RGB', (40, 30), 'red').save(output, 'PNG')
+        self.image = (
+            'data:image/png;base64,'
+            + base64.b64encode(output.getvalue()).decode()
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def new_recipe(self, **fields):
+        return {
+            'name': 'Блины', 'text': 'Текст', 'cooking_time': 20,
+            'image': self.image, 'tags': [self.tag.id],
+            'ingredients': [{'id': self.ingredient.id, 'amount': 300}],
+            **fields
+        }
+
+    def test_results_per_item(self):
+        response = self.client.post('/api/recipes/batch/', [
+            self.new_recipe(),
+            {'id': self.own.id, 'name': 'Новое название'},
+            {'id': self.other.id, 'name': 'Чужое'},
+            self.new_recipe(tags=[0]),
+            'рецепт',
+            {'id': 0},
+        ], format='json')
+        self.assertEqual(response.status_code, 200)
+        created, updated, *errors = response.data
+        recipe = Recipe.objects.get(id=created['id'])
+        self.assertEqual(recipe.name, 'Блины')
+        self.assertEqual(list(recipe.tags.all()), [self.tag])
+        self.assertEqual(
+            list(recipe.ingredientsperrecipe_set.values_list(
+                'ingredient_id', 'amount'
+            )),
+            [(self.ingredient.id, 300)]
+        )
+        self.assertEqual(updated, {'id': self.own.id})
+        self.own.refresh_from_db()
+        self.assertEqual(self.own.name, 'Новое название')
+        self.assertEqual(
+            [sorted(item['errors']) for item in errors],
+            [['id'], ['tags'], ['non_field_errors'], ['id']]
+        )
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.name, 'Рецепт')
+        self.assertEqual(Recipe.objects.count(), 3)
+
+    @override_settings(RECIPE_BATCH_SIZE=1)
+    def test_size_limit(self):
+        response = self.client.post(
+            '/api/recipes/batch/', [self.new_recipe()] * 2, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Recipe.objects.count(), 2)
+
+
+class ConditionalRequestTests(TransactionTestCase):
+    """Повторный запрос получает 304, только пока данные не изменились."""
+
+    def test_author_rename(self):
+        author = create_user('author')
+        recipe = create_recipe(author)
+        client = APIClient()
+        url = f'/api/recipes/{recipe.id}/'
+        response = client.get(url)
+        self.assertNotIn('Last-Modified', response)
+        etag = response['ETag']
+        self.assertEqual(
+            client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+        author.first_name = 'Новое'
+        author.save()
+        response = client.get(
+            url, HTTP_IF_NONE_MATCH=etag,
+            HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['author']['first_name'], 'Новое')
+
+
+class CacheVersionTests(TransactionTestCase):
+    """Версия повышается только после фиксации транзакции."""
+
+    def test_bump_after_commit(self):
+        version = get_version('test')
+        with transaction.atomic():
+            bump_version('test')
+            self.assertEqual(get_version('test'), version)
+        self.assertEqual(get_version('test'), version + 1)
+
+    def test_no_bump_on_rollback(self):
+        version = get_version('test')
+        with self.assertRaises(ValueError), transaction.atomic():
+            bump_version('test')
+            raise ValueError
+        self.assertEqual(get_version('test'), version)
+
+
+class RecipeUpdateTests(TestCase):
+    """Изменение рецепта."""
+
+    def setUp(self):
+        self.author = create_user('author')
+        self.recipe = create_recipe(self.author)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_only_owner_can_patch(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        response = self.client_for(create_user('reader')).patch(
+            url, {'name': 'Чужое'}, format='json'
+        )
+        self.assertEqual(response.status_code, 403)
+        response = self.client_for(self.author).patch(
+            url, {'name': 'Своё'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.name, 'Своё')
+
+    def test_ingredient_diff(self):
+        flour, sugar, salt = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('мука', 'сахар', 'соль')
+        )
+        IngredientsPerRecipe.objects.bulk_create([
+            IngredientsPerRecipe(
+                recipe=self.recipe, ingredient=flour, amount=100
+            ),
+            IngredientsPerRecipe(
+                recipe=self.recipe, ingredient=sugar, amount=200
+            ),
+        ])
+        kept = IngredientsPerRecipe.objects.get(ingredient=sugar).pk
+        reader = create_user('reader')
+        ShoppingCart.objects.create(user=reader, recipe=self.recipe)
+        response = self.client_for(self.author).patch(
+            f'/api/recipes/{self.recipe.id}/', {'ingredients': [
+                {'id': sugar.id, 'amount': 250},
+                {'id': salt.id, 'amount': 5},
+            ]}, format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        rows = IngredientsPerRecipe.objects.filter(recipe=self.recipe)
+        self.assertEqual(
+            dict(rows.values_list('ingredient__name', 'amount')),
+            {'сахар': 250, 'соль': 5}
+        )
+        self.assertEqual(rows.get(ingredient=sugar).pk, kept)
+        self.assertEqual(
+            dict(ShoppingListItem.objects.filter(
+                user=reader
+            ).values_list('ingredient__name', 'amount')),
+            {'сахар': 250, 'соль': 5}
+        )
+
+
+class CounterTests(TestCase):
+    """Сохранение записей не затирает счётчики, которые меняют UPDATE."""
+
+    def setUp(self):
+        self.author = create_user('author')
+        self.reader = create_user('reader')
+        self.recipe = create_recipe(self.author)
+
+    def test_recipe_update_keeps_favorites_count(self):
+        stale = Recipe.objects.get(id=self.recipe.id)
+        Favorite.objects.create(user=self.reader, recipe=self.recipe)
+        serializer = RecipePostSerializer(
+            stale, data={'name': 'Новое'}, partial=True
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.name, 'Новое')
+        self.assertEqual(self.recipe.favorites_count, 1)
+
+    def test_set_password_keeps_followers_count(self):
+        client = APIClient()
+        client.force_authenticate(self.author)
+        Follow.objects.create(user=self.reader, author=self.author)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post('/api/users/set_password/', {
+                'current_password': 'pass', 'new_password': 'new-pass-123'
+            })
+        self.assertEqual(response.status_code, 204)
+        updates = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('UPDATE "users_customuser"')
+        ]
+        self.assertTrue(updates)
+        self.assertFalse(any('followers_count' in sql for sql in updates))
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 1)
+
+    def test_decrements_stop_at_zero(self):
+        client = APIClient()
+        client.force_authenticate(self.reader)
+        Follow.objects.create(user=self.reader, author=self.author)
+        CustomUser.objects.filter(id=self.author.id).update(
+            followers_count=0, recipes_count=0
+        )
+        response = client.delete(f'/api/users/{self.author.id}/subscribe/')
+        self.assertEqual(response.status_code, 204)
+        self.recipe.delete()
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 0)
+        self.assertEqual(self.author.recipes_count, 0)
+
+
+class UserSaveVersionTests(TransactionTestCase):
+    """Сохранение пользователя сбрасывает кэш рецептов только по делу."""
+
+    def setUp(self):
+        self.author = create_user('author')
+        create_recipe(self.author)
+        self.key = content_version_key('recipes')
+
+    def assert_bumped(self, change, bumped):
+        version = get_version(self.key)
+        change()
+        self.assertEqual(get_version(self.key), version + bumped)
+
+    def test_irrelevant_saves(self):
+        def set_password():
+            self.author.set_password('new-pass-123')
+            self.author.save()
+
+        self.assert_bumped(lambda: create_user('reader'), 0)
+        self.assert_bumped(set_password, 0)
+        self.assert_bumped(
+            lambda: self.author.save(update_fields=['last_login']), 0
+        )
+
+    def test_author_rename(self):
+        def rename(user):
+            user.first_name = 'Новое'
+            user.save()
+
+        self.assert_bumped(lambda: rename(self.author), 1)
+        self.assert_bumped(lambda: rename(create_user('reader')), 0)
+
+
+class IngredientImportTests(TransactionTestCase):
+    """После импорта ингредиентов кэш и индекс поиска обновляются."""
+
+    def test_import_csv(self):
+        base_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(base_dir.cleanup)
+        os.mkdir(os.path.join(base_dir.name, 'data'))
+        path = os.path.join(base_dir.name, 'data', 'ingredients.csv')
+        with open(path, 'w', encoding='utf8') as csv_file:
+            csv_file.write('абрикосы,г\nбаклажаны,г\n')
+        client = APIClient()
+        etag = client.get('/api/ingredients/')['ETag']
+        self.assertEqual(
+            client.get('/api/ingredients/', {'name': 'абр'}).data, []
+        )
+        with override_settings(BASE_DIR=base_dir.name):
+            call_command('import_csv')
+        response = client.get('/api/ingredients/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(
+            [item['name'] for item in client.get(
+                '/api/ingredients/', {'name': 'абр'}
+            ).data],
+            ['абрикосы']
+        )
+
+
+class IdempotencyTests(TestCase):
+    """Повтор с тем же Idempotency-Key получает сохранённый ответ."""
+
+    def setUp(self):
+        self.user = create_user('user')
+        self.recipes = [
+            create_recipe(self.user, f'Рецепт {number}') for number in (1, 2)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, recipes, key='key'):
+        return self.client.post(
+            '/api/recipes/favorite/',
+            {'recipes': [recipe.id for recipe in recipes]}, format='json',
+            HTTP_IDEMPOTENCY_KEY=key
+        )
+
+    def test_replay_survives_cache_clear(self):
+        first = self.post(self.recipes[:1])
+        Favorite.objects.all().delete()
+        cache.clear()
+        second = self.post(self.recipes[:1])
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.status_code, first.status_code)
+        self.assertEqual(second.data, first.data)
+        self.assertFalse(Favorite.objects.exists())
+
+    def test_other_body_not_replayed(self):
+        self.post(self.recipes[:1])
+        response = self.post(self.recipes)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+        self.assertEqual(
+            response.data['recipes'], sorted(r.id for r in self.recipes)
+        )
+        self.assertEqual(Favorite.objects.count(), 2)
+
+    def test_bulk_delete(self):
+        self.post(self.recipes)
+        response = self.client.delete(
+            '/api/recipes/favorite/', {'recipes': [self.recipes[0].id]},
+            format='json'
+        )
+        self.assertEqual(response.data['recipes'], [self.recipes[0].id])
+        self.assertEqual(
+            list(Favorite.objects.values_list('recipe_id', flat=True)),
+            [self.recipes[1].id]
+        )
@@ -1,8 +1,10 @@
 from django.urls import include, path
 from rest_framework import routers
 
-from api.views import (FavoriteViewSet, IngredientViewSet, RecipeViewSet,
-                       ShoppingCartViewSet, TagViewSet, download_cart)
+from api.views import (BulkFavoriteViewSet, BulkShoppingCartViewSet,
+                       FavoriteViewSet, IngredientViewSet, RecipeViewSet,
+                       ShoppingCartViewSet, TagViewSet, batch_recipes,
+                       download_cart)
 
 app_name = 'api'
 
@@ -14,6 +16,15 @@ router.register(r'ingredients', IngredientViewSet)
 urlpatterns = [
     path('recipes/download_shopping_cart/',
          download_cart, name='download_cart'),
+    path('recipes/batch/', batch_recipes, name='batch_recipes'),
+    path('recipes/favorite/',
+         BulkFavoriteViewSet.as_view({'post': 'create', 'delete': 'destroy'}),
+         name='bulk_favorite'),
+    path('recipes/shopping_cart/',
+         BulkShoppingCartViewSet.as_view(
+             {'post': 'create', 'delete': 'destroy'}
+         ),
+         name='bulk_shopping_cart'),
     path('', include(router.urls)),
     path('recipes/<int:recipe_id>/favorite/',
          FavoriteViewSet.as_view({'post': 'create', 'delete': 'destroy'}),
@@ -1,23 +1,49 @@
-from django.http import HttpResponse
-from rest_framework import filters, mixins, status, viewsets
-from rest_framework.decorators import api_view
+from functools import partial
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+from django.db.models import Max
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework import mixins, status, viewsets
+from rest_framework.decorators import action, api_view
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import (AllowAny, IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
 
+from .batch import save_recipe_batch
+from .caching import (AnonymousListCacheMixin, content_version_key,
+                      get_version, get_versions, user_version_key)
+from .conditional import ContentETagMixin, conditional_response, make_etag
+from .filters import RecipeFilter
+from .idempotency import create_once, delete_once, delete_rows, idempotent
+from .parsers import RawImageParser
 from .permissions import IsAdminOrOwner
+from .relations import get_relations, invalidate_relations
 from .serializers import (IngredientSerializer, RecipeGetSerializer,
+                          RecipeIdsSerializer, RecipeImageSerializer,
                           RecipePostSerializer, TagSerializer)
-from recipes.models import (Favorite, Ingredient, IngredientsPerRecipe, Recipe,
-                            ShoppingCart, Tag)
+from .shopping_list import EXPORT_FORMATS, get_cart_ingredients, merge_units
+from recipes.counters import sync_favorites_count
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from recipes.search import fuzzy_search, ingredient_index
+from recipes.shopping_list import rebuild
+from users.models import CustomUser
 from users.serializers import SimpleRecipeSerializer
-from users.views import LimitPageNumberPagination
+from users.views import FeedPagination
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(AnonymousListCacheMixin, viewsets.ModelViewSet):
     """Вьюсет для модели Recipe."""
     queryset = Recipe.objects.all()
-    pagination_class = LimitPageNumberPagination
+    cache_scopes = ('recipes', 'tags', 'ingredients')
+    pagination_class = FeedPagination
+    filter_backends = (DjangoFilterBackend, )
+    filterset_class = RecipeFilter
 
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
@@ -33,56 +59,104 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return context
 
     def get_permissions(self):
-        if self.action in ['update', 'destroy']:
+        if self.action in ['update', 'partial_update', 'destroy', 'image']:
             return [IsAuthenticated(), IsAdminOrOwner()]
         return [IsAuthenticatedOrReadOnly(), ]
 
     def get_queryset(self):
-        if self.request.user.is_authenticated:
-            if self.request.query_params.get('is_in_shopping_cart'):
-                qs = ShoppingCart.objects.filter(
-                    user=self.request.user
-                ).values_list('recipe_id', flat=True)
-                queryset = Recipe.objects.filter(id__in=qs)
-            elif self.request.query_params.get('is_favorited'):
-                qs = Favorite.objects.filter(
-                    user=self.request.user
-                ).values_list('recipe_id', flat=True)
-                queryset = Recipe.objects.filter(id__in=qs)
-            elif self.request.query_params.get('author'):
-                queryset = Recipe.objects.filter(
-                    author_id=self.request.query_params.get('author')
-                )
-            else:
-                queryset = Recipe.objects.all()
-        else:
-            queryset = Recipe.objects.all()
-        if self.request.query_params.get('tags'):
-            tags = []
-            tags = self.request.query_params.getlist('tags')
-            queryset = queryset.filter(tags__slug__in=tags).distinct()
+        queryset = Recipe.objects.all()
+        if self.action in ['list', 'retrieve']:
+            queryset = queryset.select_related('author')
         return queryset
 
+    def get_recipe_etag(self):
+        """ETag рецепта без загрузки и сериализации."""
+        pk = str(self.kwargs['pk'])
+        if not pk.isdigit():
+            return None
+        row = Recipe.objects.filter(pk=pk).values_list(
+            'id', 'updated_at', 'author_id'
+        ).first()
+        if row is None:
+            return None
+        recipe_id, updated_at, author_id = row
+        keys = [
+            user_version_key(author_id),
+            content_version_key('tags'),
+            content_version_key('ingredients'),
+        ]
+        versions = get_versions(keys)
+        relations = get_relations(self.request.user)
+        return make_etag(
+            self.request.get_host(), recipe_id, updated_at.isoformat(),
+            *(versions[key] for key in keys),
+            recipe_id in relations.favorites,
+            recipe_id in relations.shopping_cart,
+            author_id in relations.following,
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return conditional_response(
+            request, partial(super().retrieve, request, *args, **kwargs),
+            self.get_recipe_etag()
+        )
+
+    @action(
+        methods=['put'], detail=True, url_path='image',
+        parser_classes=(MultiPartParser, RawImageParser)
+    )
+    def image(self, request, pk=None):
+        """Загрузка картинки файлом: multipart или сырым телом запроса.
+
+        Файл пишется на диск обработчиками загрузки Django и не проходит
+        через JSON и base64.
+        """
+        recipe = self.get_object()
+        upload = request.data.get('image') or request.data.get('file')
+        serializer = RecipeImageSerializer(
+            recipe, data={'image': upload},
+            context=self.get_serializer_context()
+        )
+        try:
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+        finally:
+            if isinstance(upload, UploadedFile):
+                # Файл из тела запроса не попадает в request.FILES, и
+                # Django не закроет его сам.
+                upload.close()
+        return Response(serializer.data)
+
 
 class TagViewSet(
-    mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet
+    ContentETagMixin, AnonymousListCacheMixin, mixins.ListModelMixin,
+    mixins.RetrieveModelMixin, viewsets.GenericViewSet
 ):
     """Вьюсет для модели Tag."""
     queryset = Tag.objects.all()
+    cache_scopes = ('tags', )
     serializer_class = TagSerializer
     permission_classes = [AllowAny, ]
 
 
 class IngredientViewSet(
-    mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet
+    ContentETagMixin, AnonymousListCacheMixin, mixins.ListModelMixin,
+    mixins.RetrieveModelMixin, viewsets.GenericViewSet
 ):
     """Вьюсет для модели Ingredient."""
     queryset = Ingredient.objects.all()
+    cache_scopes = ('ingredients', )
     serializer_class = IngredientSerializer
-    filter_backends = (filters.SearchFilter, )
-    search_fields = ('^name', )
     permission_classes = [AllowAny, ]
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if not name:
+            return super().list(request, *args, **kwargs)
+        if request.query_params.get('mode') == 'fuzzy':
+            return Response(fuzzy_search(name))
+        return Response(ingredient_index.search(name))
+
 
 class FavoriteViewSet(
     mixins.CreateModelMixin, mixins.DestroyModelMixin, viewsets.GenericViewSet
@@ -91,30 +165,18 @@ class FavoriteViewSet(
     queryset = Favorite.objects.all()
     serializer_class = SimpleRecipeSerializer
 
+    @idempotent
     def create(self, request, *args, **kwargs):
-        Favorite.objects.get_or_create(
-            recipe_id=self.kwargs.get('recipe_id'), user=request.user
-        )
-        instance = Recipe.objects.get(id=self.kwargs.get('recipe_id'))
-        data = {
-            'id': instance.pk,
-            'name': instance.name,
-            'image': instance.image,
-            'cooking_time': instance.cooking_time
-        }
-        serializer = SimpleRecipeSerializer(instance, data=data)
-        serializer.is_valid(raise_exception=True)
-        self.perform_create(serializer)
-        headers = self.get_success_headers(serializer.data)
-        return Response(
-            serializer.data, status=status.HTTP_201_CREATED, headers=headers
-        )
+        recipe = get_object_or_404(Recipe, id=self.kwargs.get('recipe_id'))
+        create_once(Favorite, recipe=recipe, user=request.user)
+        serializer = self.get_serializer(recipe)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @idempotent
     def destroy(self, request, *args, **kwargs):
-        instance = Favorite.objects.filter(
-            recipe_id=self.kwargs.get('recipe_id'), user=request.user
-        )[0]
-        self.perform_destroy(instance)
+        delete_once(
+            Favorite, recipe_id=self.kwargs.get('recipe_id'), user=request.user
+        )
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -125,57 +187,138 @@ class ShoppingCartViewSet(
     queryset = ShoppingCart.objects.all()
     serializer_class = SimpleRecipeSerializer
 
+    @idempotent
     def create(self, request, *args, **kwargs):
-        ShoppingCart.objects.get_or_create(
-            recipe_id=self.kwargs.get('recipe_id'), user=request.user
-        )
-        qs = Recipe.objects.filter(
+        recipe = Recipe.objects.filter(
             id=self.kwargs.get('recipe_id')
-        )
-        if not qs.exists():
+        ).first()
+        if recipe is None:
             return Response(
                 status=status.HTTP_400_BAD_REQUEST
             )
-        instance = qs[0]
-        data = {
-            'id': instance.pk,
-            'name': instance.name,
-            'image': instance.image,
-            'cooking_time': instance.cooking_time
-        }
-        serializer = SimpleRecipeSerializer(instance, data=data)
+        create_once(ShoppingCart, recipe=recipe, user=request.user)
+        serializer = self.get_serializer(recipe)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @idempotent
+    def destroy(self, request, *args, **kwargs):
+        delete_once(
+            ShoppingCart, recipe_id=self.kwargs.get('recipe_id'),
+            user=request.user
+        )
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class BulkRecipeRelationViewSet(viewsets.GenericViewSet):
+    """Добавляет и удаляет список рецептов за постоянное число запросов.
+
+    bulk_create и delete_rows не отправляют сигналы, поэтому зависимые
+    данные обновляются в relations_changed.
+    """
+    model = None
+    serializer_class = RecipeIdsSerializer
+
+    def get_recipe_ids(self, request):
+        serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        self.perform_create(serializer)
-        headers = self.get_success_headers(serializer.data)
+        requested = set(serializer.validated_data['recipes'])
+        found = set(Recipe.objects.filter(
+            id__in=requested
+        ).values_list('id', flat=True))
+        return found, requested - found
+
+    def relations_changed(self, user, recipe_ids):
+        invalidate_relations(user.id)
+
+    @idempotent
+    @transaction.atomic
+    def create(self, request, *args, **kwargs):
+        found, missing = self.get_recipe_ids(request)
+        if found:
+            self.model.objects.bulk_create((
+                self.model(user=request.user, recipe_id=recipe_id)
+                for recipe_id in found
+            ), ignore_conflicts=True)
+            self.relations_changed(request.user, found)
         return Response(
-            serializer.data, status=status.HTTP_201_CREATED, headers=headers
+            {'recipes': sorted(found), 'not_found': sorted(missing)}
         )
 
+    @idempotent
+    @transaction.atomic
     def destroy(self, request, *args, **kwargs):
-        instance = ShoppingCart.objects.filter(
-            recipe_id=self.kwargs.get('recipe_id'), user=request.user
-        )[0]
-        self.perform_destroy(instance)
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        found, missing = self.get_recipe_ids(request)
+        if found:
+            delete_rows(self.model, user_id=request.user.id, recipe_id=found)
+            self.relations_changed(request.user, found)
+        return Response(
+            {'recipes': sorted(found), 'not_found': sorted(missing)}
+        )
+
+
+class BulkFavoriteViewSet(BulkRecipeRelationViewSet):
+    """Массовое добавление и удаление избранного."""
+    model = Favorite
+
+    def relations_changed(self, user, recipe_ids):
+        super().relations_changed(user, recipe_ids)
+        sync_favorites_count(recipe_ids)
+
+
+class BulkShoppingCartViewSet(BulkRecipeRelationViewSet):
+    """Массовое добавление и удаление рецептов из корзины."""
+    model = ShoppingCart
+
+    def relations_changed(self, user, recipe_ids):
+        super().relations_changed(user, recipe_ids)
+        CustomUser.objects.filter(id=user.id).update(
+            cart_updated_at=timezone.now()
+        )
+        rebuild(user.id)
 
 
 @api_view()
 def download_cart(request):
     """View-функция для скачивания списка ингредиентов."""
-    qs = ShoppingCart.objects.filter(user=request.user).values_list(
-        'recipe_id', flat=True
+    file_format = request.query_params.get('file_format', 'txt')
+    if file_format not in EXPORT_FORMATS:
+        formats = ', '.join(EXPORT_FORMATS)
+        return Response(
+            {'file_format': [f'Доступные форматы: {formats}.']},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    content_type, render = EXPORT_FORMATS[file_format]
+
+    def render_cart():
+        response = StreamingHttpResponse(
+            render(merge_units(get_cart_ingredients(request.user))),
+            content_type=content_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename=ingredients.{file_format}'
+        )
+        return response
+
+    cart_updated_at, recipes_updated_at = CustomUser.objects.filter(
+        id=request.user.id
+    ).annotate(
+        recipes_updated_at=Max('shoppingcart__recipe__updated_at')
+    ).values_list('cart_updated_at', 'recipes_updated_at').get()
+    etag = make_etag(
+        request.user.id, file_format, cart_updated_at, recipes_updated_at,
+        get_version(content_version_key('ingredients'))
     )
-    recipes = Recipe.objects.filter(id__in=qs)
-    ingredients_list = {}
-    for recipe in recipes:
-        for ingredient in recipe.ingredients.all():
-            amount = IngredientsPerRecipe.objects.get(
-                recipe=recipe, ingredient=ingredient
-            ).amount
-            key = f'{ingredient.name} ({ingredient.measurement_unit}) - '
-            ingredients_list[key] = ingredients_list.get(key, 0) + amount
-    response = HttpResponse(content_type='text/plain; charset=UTF-8')
-    response['Content-Disposition'] = 'attachment; filename=ingredients.txt'
-    for name, amount in ingredients_list.items():
-        response.write(name + str(amount) + '\n')
-    return response
+    return conditional_response(request, render_cart, etag)
+
+
+@api_view(['POST'])
+def batch_recipes(request):
+    """View-функция для пакетного создания и изменения рецептов."""
+    items = request.data
+    limit = settings.RECIPE_BATCH_SIZE
+    if not isinstance(items, list) or not 0 < len(items) <= limit:
+        return Response(
+            {'detail': f'Ожидается список от 1 до {limit} рецептов.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    return Response(save_recipe_batch(items, request))
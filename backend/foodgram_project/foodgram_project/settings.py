@@ -45,11 +45,13 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'django_filters',
-    'api',
-    'users',
-    'recipes',
+    'api.apps.ApiConfig',
+    'users.apps.UsersConfig',
+    'recipes.apps.RecipesConfig',
+    'jobs.apps.JobsConfig',
     'rest_framework_simplejwt.token_blacklist',
     'corsheaders',
 ]
@@ -101,6 +103,47 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    }
+}
+
+RELATIONS_CACHE_TIMEOUT = 300
+
+RECIPE_DOCUMENT_TIMEOUT = 60 * 60 * 24
+
+RECIPE_BATCH_SIZE = 100
+
+IDEMPOTENCY_KEY_TIMEOUT = 60 * 60 * 24
+
+IMAGE_UPLOAD_MAX_BYTES = 10 * 2 ** 20
+IMAGE_MAX_PIXELS = 40_000_000
+IMAGE_SPOOL_MAX_SIZE = 2 ** 20
+IMAGE_DECODE_CHUNK_SIZE = 64 * 2 ** 10
+IMAGE_VARIANT_WIDTHS = (160, 320, 640, 1280)
+IMAGE_VARIANT_QUALITY = 80
+
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_DELAY = 10
+JOB_RETRY_MAX_DELAY = 60 * 60
+JOB_STALE_TIMEOUT = 15 * 60
+JOB_POLL_INTERVAL = 1
+
+API_CACHE_TIMEOUTS = {
+    'recipes': 60,
+    'tags': 60 * 60,
+    'ingredients': 60 * 60,
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -161,6 +204,7 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 MEDIA_URL = '/images/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'images')
+DEFAULT_FILE_STORAGE = 'recipes.storage.ContentHashStorage'
 
 AUTH_USER_MODEL = 'users.CustomUser'
 
@@ -169,3 +213,14 @@ CORS_URLS_REGEX = r'^/api/.*$'
 CORS_ALLOWED_ORIGINS = [
     'http://127.0.0.1:3000',
 ]
+
+
+# Ingredient autocomplete
+
+INGREDIENT_SEARCH_LIMIT = 50
+INGREDIENT_SIMILARITY_THRESHOLD = 0.3
+
+
+# Recipe search
+
+RECIPE_SIMILARITY_THRESHOLD = 0.3
@@ -0,0 +1,13 @@
+from django.contrib import admin
+
+from jobs.models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = (
+        'pk', 'task', 'status', 'priority', 'attempts', 'run_at',
+        'created_at',
+    )
+    list_filter = ('status', 'task')
+    search_fields = ('dedupe_key', )
@@ -0,0 +1,82 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from jobs.queue import claim_jobs, execute, finish_job, release_stale_jobs
+
+
+class Command(BaseCommand):
+    help = 'Выполняет задачи фоновой очереди в пуле процессов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=os.cpu_count(),
+            help='Число процессов пула.'
+        )
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Завершиться, когда готовых задач не останется.'
+        )
+
+    def make_pool(self):
+        # spawn, а не fork: дочерние процессы открывают свои соединения
+        # с базой и не делят сокет с родителем.
+        return ProcessPoolExecutor(
+            self.processes, mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup
+        )
+
+    def handle(self, *args, **options):
+        self.processes = max(1, options['processes'])
+        self.pool = self.make_pool()
+        self.running = {}
+        self.finished = 0
+        try:
+            while True:
+                release_stale_jobs()
+                for job in claim_jobs(self.processes - len(self.running)):
+                    future = self.pool.submit(execute, job.task, job.args)
+                    self.running[future] = job
+                if self.running:
+                    self.collect()
+                    continue
+                if options['burst']:
+                    break
+                time.sleep(settings.JOB_POLL_INTERVAL)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.pool.shutdown()
+        self.stdout.write(f'Обработано задач - {self.finished}')
+
+    def collect(self):
+        """Ждёт завершения задач и записывает результат в очередь."""
+        done, _ = wait(
+            self.running, timeout=settings.JOB_POLL_INTERVAL,
+            return_when=FIRST_COMPLETED
+        )
+        lost = []
+        for future in done:
+            job = self.running.pop(future)
+            try:
+                error = future.result()
+            except BrokenProcessPool:
+                lost.append(job)
+                continue
+            finish_job(job, error)
+            self.finished += 1
+        if not lost:
+            return
+        # Процесс пула упал, и задачи пула потеряны: они уходят на
+        # повтор, а пул создаётся заново.
+        for job in lost + list(self.running.values()):
+            finish_job(job, 'Процесс пула завершился аварийно.')
+        self.running.clear()
+        self.pool.shutdown(wait=False)
+        self.pool = self.make_pool()
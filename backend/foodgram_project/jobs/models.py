@@ -0,0 +1,53 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """Задача фоновой очереди.
+
+    Выполненные задачи удаляются, упавшие после всех попыток остаются
+    со статусом failed.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (FAILED, 'Ошибка'),
+    )
+
+    task = models.CharField('Задача', max_length=200)
+    args = models.TextField('Аргументы в JSON', default='[]')
+    priority = models.SmallIntegerField('Приоритет', default=0)
+    status = models.CharField(
+        'Статус', max_length=10, choices=STATUSES, default=QUEUED
+    )
+    dedupe_key = models.CharField(
+        'Ключ дедупликации', max_length=200, null=True, blank=True
+    )
+    attempts = models.PositiveSmallIntegerField('Попыток', default=0)
+    max_attempts = models.PositiveSmallIntegerField('Максимум попыток')
+    run_at = models.DateTimeField('Запуск не раньше', default=timezone.now)
+    locked_by = models.CharField('Воркер', max_length=32, blank=True)
+    locked_at = models.DateTimeField('Взята в работу', null=True, blank=True)
+    last_error = models.TextField('Последняя ошибка', blank=True)
+    created_at = models.DateTimeField('Создана', auto_now_add=True)
+
+    class Meta:
+        ordering = ('-priority', 'run_at', 'id')
+        indexes = (
+            models.Index(
+                fields=('status', '-priority', 'run_at'),
+                name='job_queue_idx'
+            ),
+        )
+        constraints = (
+            models.UniqueConstraint(
+                fields=('dedupe_key', ), condition=models.Q(status='queued'),
+                name='job_queued_dedupe_key_unique'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.task} ({self.status})'
@@ -0,0 +1,122 @@
+import json
+import traceback
+from datetime import timedelta
+from uuid import uuid4
+
+from django.conf import settings
+from django.db import (IntegrityError, close_old_connections, connection,
+                       transaction)
+from django.db.models import F, Subquery
+from django.utils import timezone
+
+from jobs.models import Job
+
+TASKS = {}
+
+
+def task(func):
+    """Регистрирует функцию как задачу, которую можно поставить в очередь.
+
+    Аргументы задачи должны сериализоваться в JSON, а сама задача должна
+    выдерживать повторный запуск.
+    """
+    TASKS[f'{func.__module__}.{func.__name__}'] = func
+    return func
+
+
+def make_job(func, args=(), priority=0, dedupe_key=None, delay=0,
+             max_attempts=None):
+    name = f'{func.__module__}.{func.__name__}'
+    if TASKS.get(name) is not func:
+        raise ValueError(f'{name} не зарегистрирована как задача.')
+    return Job(
+        task=name, args=json.dumps(list(args)), priority=priority,
+        dedupe_key=dedupe_key,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+    )
+
+
+def enqueue_jobs(jobs):
+    """Ставит задачи в очередь одним запросом.
+
+    Задача с dedupe_key, который уже ждёт в очереди, пропускается.
+    Задачи пишутся в ту же базу и в той же транзакции, что и данные,
+    поэтому воркер не увидит задачу раньше, чем её данные.
+    """
+    Job.objects.bulk_create(jobs, ignore_conflicts=True)
+
+
+def enqueue(func, *args, **options):
+    enqueue_jobs([make_job(func, args, **options)])
+
+
+def claim_jobs(limit):
+    """Забирает до limit готовых к запуску задач в порядке приоритета."""
+    if limit <= 0:
+        return []
+    now = timezone.now()
+    token = uuid4().hex
+    ready = Job.objects.filter(status=Job.QUEUED, run_at__lte=now)
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            ids = list(ready.select_for_update(
+                skip_locked=True
+            ).values_list('id', flat=True)[:limit])
+        else:
+            # Один UPDATE с подзапросом: на SQLite он сразу берёт
+            # блокировку на запись и не упирается в чужое чтение.
+            ids = Subquery(ready.values('id')[:limit])
+        Job.objects.filter(id__in=ids, status=Job.QUEUED).update(
+            status=Job.RUNNING, locked_by=token, locked_at=now,
+            attempts=F('attempts') + 1
+        )
+    return list(Job.objects.filter(locked_by=token, status=Job.RUNNING))
+
+
+def retry_delay(attempts):
+    return min(
+        settings.JOB_RETRY_DELAY * 2 ** (attempts - 1),
+        settings.JOB_RETRY_MAX_DELAY
+    )
+
+
+def finish_job(job, error=None):
+    """Удаляет выполненную задачу или планирует повтор упавшей."""
+    claimed = Job.objects.filter(
+        id=job.id, status=Job.RUNNING, locked_by=job.locked_by
+    )
+    if error is None:
+        claimed.delete()
+        return
+    if job.attempts >= job.max_attempts:
+        claimed.update(status=Job.FAILED, last_error=error)
+        return
+    run_at = timezone.now() + timedelta(seconds=retry_delay(job.attempts))
+    try:
+        with transaction.atomic():
+            claimed.update(
+                status=Job.QUEUED, run_at=run_at, locked_by='',
+                last_error=error
+            )
+    except IntegrityError:
+        # Такая же задача уже снова ждёт в очереди и сделает эту работу.
+        claimed.delete()
+
+
+def release_stale_jobs():
+    """Возвращает в очередь задачи воркеров, которые не отчитались."""
+    deadline = timezone.now() - timedelta(seconds=settings.JOB_STALE_TIMEOUT)
+    stale = Job.objects.filter(status=Job.RUNNING, locked_at__lt=deadline)
+    for job in stale:
+        finish_job(job, 'Воркер не завершил задачу вовремя.')
+
+
+def execute(name, args):
+    """Выполняет задачу в процессе пула и возвращает текст ошибки."""
+    close_old_connections()
+    try:
+        TASKS[name](*json.loads(args))
+    except Exception:
+        return traceback.format_exc()
+    return None
@@ -0,0 +1,94 @@
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from jobs.models import Job
+from jobs.queue import (claim_jobs, enqueue, finish_job, release_stale_jobs,
+                        task)
+
+
+@task
+def noop(*args):
+    pass
+
+
+class QueueTests(TestCase):
+    """Очередь забирает, повторяет и не дублирует задачи."""
+
+    def test_dedupe_key(self):
+        enqueue(noop, 1, dedupe_key='key')
+        enqueue(noop, 2, dedupe_key='key')
+        self.assertEqual(Job.objects.count(), 1)
+        claim_jobs(1)
+        # Пока задача выполняется, такая же может снова ждать в очереди.
+        enqueue(noop, 3, dedupe_key='key')
+        self.assertEqual(
+            list(Job.objects.order_by('id').values_list('status', 'args')),
+            [(Job.RUNNING, '[1]'), (Job.QUEUED, '[3]')]
+        )
+
+    def test_claim_order_and_limit(self):
+        for priority in (0, 5, 1):
+            enqueue(noop, priority, priority=priority)
+        enqueue(noop, 'позже', priority=9, delay=60)
+        jobs = claim_jobs(2)
+        self.assertEqual(sorted(job.priority for job in jobs), [1, 5])
+        for job in jobs:
+            self.assertEqual(job.status, Job.RUNNING)
+            self.assertEqual(job.attempts, 1)
+        self.assertEqual([job.priority for job in claim_jobs(5)], [0])
+        self.assertEqual(claim_jobs(5), [])
+
+    def test_success_removes_job(self):
+        enqueue(noop)
+        finish_job(claim_jobs(1)[0])
+        self.assertFalse(Job.objects.exists())
+
+    @override_settings(JOB_RETRY_DELAY=10, JOB_RETRY_MAX_DELAY=15)
+    def test_retry_backoff_and_failure(self):
+        enqueue(noop, max_attempts=3)
+        job = claim_jobs(1)[0]
+        started = timezone.now()
+        finish_job(job, 'ошибка')
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertEqual(job.last_error, 'ошибка')
+        self.assertGreaterEqual(job.run_at, started + timedelta(seconds=10))
+        Job.objects.update(run_at=started)
+        job = claim_jobs(1)[0]
+        finish_job(job, 'ошибка')
+        job.refresh_from_db()
+        # Задержка удваивается, но не больше JOB_RETRY_MAX_DELAY.
+        self.assertLess(job.run_at, timezone.now() + timedelta(seconds=16))
+        Job.objects.update(run_at=started)
+        job = claim_jobs(1)[0]
+        finish_job(job, 'ошибка')
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 3)
+        self.assertEqual(claim_jobs(1), [])
+
+    def test_retry_with_queued_duplicate(self):
+        enqueue(noop, dedupe_key='key')
+        job = claim_jobs(1)[0]
+        enqueue(noop, dedupe_key='key')
+        finish_job(job, 'ошибка')
+        self.assertEqual(
+            list(Job.objects.values_list('status', 'attempts')),
+            [(Job.QUEUED, 0)]
+        )
+
+    @override_settings(JOB_STALE_TIMEOUT=60)
+    def test_release_stale_jobs(self):
+        enqueue(noop)
+        enqueue(noop)
+        stale, fresh = claim_jobs(2)
+        Job.objects.filter(id=stale.id).update(
+            locked_at=timezone.now() - timedelta(seconds=120)
+        )
+        release_stale_jobs()
+        self.assertEqual(
+            dict(Job.objects.values_list('id', 'status')),
+            {stale.id: Job.QUEUED, fresh.id: Job.RUNNING}
+        )
@@ -1,13 +1,14 @@
 from django.contrib import admin
 
 from recipes.models import (Favorite, Ingredient, IngredientsPerRecipe, Recipe,
-                            ShoppingCart, Tag, TagsOnRecipe)
+                            ShoppingCart, ShoppingListItem, Tag, TagsOnRecipe)
 
 admin.site.register(Favorite)
 admin.site.register(Tag)
 admin.site.register(IngredientsPerRecipe)
 admin.site.register(TagsOnRecipe)
 admin.site.register(ShoppingCart)
+admin.site.register(ShoppingListItem)
 
 
 class RecipeIngredientInline(admin.TabularInline):
@@ -18,7 +19,7 @@ class RecipeIngredientInline(admin.TabularInline):
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     list_display = (
-        'pk', 'text', 'name', 'author', 'cooking_time',
+        'pk', 'text', 'name', 'author', 'cooking_time', 'favorites_count',
     )
     readonly_fields = ('fav_count',)
     list_filter = ('name', 'author', 'tags')
@@ -26,7 +27,7 @@ class RecipeAdmin(admin.ModelAdmin):
     inlines = (RecipeIngredientInline, )
 
     def fav_count(self, obj):
-        return f'{Favorite.objects.filter(recipe_id=obj.id).count()}'
+        return f'{obj.favorites_count}'
 
 
 @admin.register(Ingredient)
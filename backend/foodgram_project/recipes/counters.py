@@ -0,0 +1,22 @@
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe
+
+
+def count_of(model, field):
+    """Подзапрос с числом строк model, ссылающихся на текущую запись."""
+    return Coalesce(Subquery(
+        model.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            total=Count('id')
+        ).values('total')
+    ), 0)
+
+
+def sync_favorites_count(recipe_ids):
+    """Пересчитывает favorites_count рецептов одним запросом."""
+    Recipe.objects.filter(id__in=recipe_ids).update(
+        favorites_count=count_of(Favorite, 'recipe')
+    )
@@ -0,0 +1,80 @@
+import posixpath
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from recipes.models import Recipe
+
+
+def variant_name(name, width):
+    """Путь WebP-копии рядом с оригиналом: images/variants/<имя>/<w>.webp."""
+    directory, filename = posixpath.split(name)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(directory, 'variants', stem, f'{width}.webp')
+
+
+def variant_widths(width):
+    """Ширины копий для картинки шириной width, включая полноразмерную."""
+    if not width:
+        return []
+    return [
+        variant for variant in settings.IMAGE_VARIANT_WIDTHS
+        if variant < width
+    ] + [width]
+
+
+def generate_variants(recipe):
+    """Сохраняет уменьшенные WebP-копии картинки рецепта.
+
+    Возвращает ширину оригинала, по которой потом строится srcset.
+    """
+    with recipe.image.open('rb') as source:
+        image = ImageOps.exif_transpose(Image.open(source))
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        has_alpha = 'A' in image.getbands() or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+    storage = recipe.image.storage
+    for width in variant_widths(image.width):
+        variant = image
+        if width != image.width:
+            height = max(1, round(image.height * width / image.width))
+            variant = image.resize((width, height), Image.LANCZOS)
+        buffer = BytesIO()
+        variant.save(
+            buffer, 'WEBP', quality=settings.IMAGE_VARIANT_QUALITY
+        )
+        name = variant_name(recipe.image.name, width)
+        content = ContentFile(buffer.getvalue())
+        if hasattr(storage, 'save_as'):
+            storage.save_as(name, content)
+        else:
+            storage.delete(name)
+            storage.save(name, content)
+    return image.width
+
+
+def known_widths(recipes):
+    """Ширины файлов этих рецептов, для которых копии уже созданы.
+
+    Одинаковые картинки хранятся одним файлом, поэтому ширина берётся
+    из другого рецепта с тем же файлом.
+    """
+    return dict(Recipe.objects.filter(
+        image__in={recipe.image.name for recipe in recipes},
+        image_width__isnull=False
+    ).exclude(
+        id__in=[recipe.id for recipe in recipes if recipe.id]
+    ).values_list('image', 'image_width'))
+
+
+def ensure_variants(recipes):
+    """Заполняет image_width, создавая копии только для новых файлов."""
+    widths = known_widths(recipes)
+    for recipe in recipes:
+        name = recipe.image.name
+        if name not in widths:
+            widths[name] = generate_variants(recipe)
+        recipe.image_width = widths[name]
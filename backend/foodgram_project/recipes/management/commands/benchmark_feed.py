@@ -0,0 +1,93 @@
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.pagination import Cursor
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe
+from users.models import CustomUser
+from users.views import LimitCursorPagination
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает время ответа ленты рецептов на первой и дальней '
+        'странице для постраничной пагинации и пагинации по курсору. '
+        'Рецепты создаются в транзакции, которая потом откатывается. '
+        'Запросы идут от пользователя с прогретым кэшем документов, '
+        'поэтому в разнице остаётся только пагинация.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page', type=int, default=1000)
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.user = CustomUser.objects.create_user(
+                email='benchmark@example.com', username='benchmark',
+                first_name='Бенчмарк', last_name='Бенчмарк'
+            )
+            self.fill(options['page'] * options['limit'])
+            self.measure(options)
+            transaction.set_rollback(True)
+
+    def fill(self, total):
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=self.user, name=f'Рецепт {number}', text='Текст',
+                image='images/recipe.png', cooking_time=10
+            ) for number in range(total)
+        )
+        # auto_now_add ставит всем одну дату, а курсору нужны разные.
+        # Рецепты новее существующих, чтобы обе страницы были из них.
+        recipes = list(Recipe.objects.filter(author=self.user).order_by('id'))
+        start = timezone.now()
+        for number, recipe in enumerate(recipes):
+            recipe.pub_date = start + timedelta(seconds=number)
+        Recipe.objects.bulk_update(recipes, ['pub_date'], batch_size=500)
+
+    def cursor_to(self, offset):
+        paginator = LimitCursorPagination()
+        paginator.base_url = ''
+        recipe = Recipe.objects.order_by(*paginator.ordering)[offset - 1]
+        position = paginator._get_position_from_instance(
+            recipe, paginator.ordering
+        )
+        url = paginator.encode_cursor(
+            Cursor(offset=0, reverse=False, position=position)
+        )
+        return url.split('=', 1)[1]
+
+    def timings(self, url, repeat):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        client.get(url)
+        results = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            response = client.get(url)
+            results.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, response.status_code
+        return statistics.median(results)
+
+    def measure(self, options):
+        page, limit = options['page'], options['limit']
+        base = f'/api/recipes/?limit={limit}'
+        urls = (
+            ('page', 1, base),
+            ('page', page, f'{base}&page={page}'),
+            ('cursor', 1, f'{base}&pagination=cursor'),
+            ('cursor', page, f'{base}&pagination=cursor&cursor='
+                             f'{self.cursor_to((page - 1) * limit)}'),
+        )
+        for mode, number, url in urls:
+            self.stdout.write(
+                f'{mode:6} страница {number:5}: '
+                f'{self.timings(url, options["repeat"]):8.1f} мс'
+            )
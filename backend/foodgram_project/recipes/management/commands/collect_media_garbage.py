@@ -0,0 +1,75 @@
+import os
+import posixpath
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.images import variant_name
+from recipes.storage import reference_counts
+
+
+class Command(BaseCommand):
+    help = 'Удаляет из MEDIA_ROOT файлы, на которые нет ссылок в базе.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', type=int, default=60 * 60,
+            help='Не трогать файлы моложе стольких секунд.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только вывести файлы, которые были бы удалены.'
+        )
+
+    def handle(self, *args, **options):
+        referenced = set(reference_counts())
+        variant_dirs = {
+            posixpath.dirname(variant_name(name, 0)) for name in referenced
+        }
+        self.referenced = referenced
+        self.variant_dirs = variant_dirs
+        self.dry_run = options['dry_run']
+        self.deadline = time.time() - options['min_age']
+        self.removed = self.freed = 0
+        if os.path.isdir(settings.MEDIA_ROOT):
+            self.collect(settings.MEDIA_ROOT)
+        self.stdout.write(
+            f'Удалено файлов - {self.removed}, '
+            f'освобождено {self.freed // 1024} КБ'
+        )
+
+    def collect(self, path):
+        # scandir отдаёт записи по одной, список каталога не строится.
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    self.collect(entry.path)
+                    self.remove_empty(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    self.check_entry(entry)
+
+    def check_entry(self, entry):
+        name = os.path.relpath(entry.path, settings.MEDIA_ROOT).replace(
+            os.sep, '/'
+        )
+        if (name in self.referenced
+                or posixpath.dirname(name) in self.variant_dirs):
+            return
+        stat = entry.stat(follow_symlinks=False)
+        if stat.st_mtime > self.deadline:
+            return
+        if self.dry_run:
+            self.stdout.write(name)
+        else:
+            os.remove(entry.path)
+        self.removed += 1
+        self.freed += stat.st_size
+
+    def remove_empty(self, path):
+        if self.dry_run:
+            return
+        try:
+            os.rmdir(path)
+        except OSError:
+            pass
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import generate_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Создаёт WebP-копии картинок рецептов, у которых их ещё нет.'
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.filter(image_width__isnull=True).exclude(
+            image=''
+        ).only('id', 'image')
+        done = 0
+        for recipe in recipes.iterator():
+            try:
+                width = generate_variants(recipe)
+            except OSError as error:
+                self.stderr.write(f'Рецепт {recipe.id}: {error}')
+                continue
+            Recipe.objects.filter(id=recipe.id).update(image_width=width)
+            done += 1
+        self.stdout.write(f'Обработано картинок - {done}')
@@ -3,6 +3,7 @@ import csv
 from django.conf import settings
 from django.core.management.base import BaseCommand
 
+from api.caching import bump_content_version
 from recipes.models import Ingredient
 
 
@@ -17,3 +18,7 @@ class Command(BaseCommand):
             item = Ingredient(name=row[0], measurement_unit=row[1])
             items.append(item)
         Ingredient.objects.bulk_create(items)
+        # bulk_create не отправляет сигналы, поэтому версия кэша
+        # ингредиентов, по которой перестраивается и индекс поиска,
+        # повышается здесь.
+        bump_content_version('ingredients')
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from recipes.counters import count_of
+from recipes.models import Favorite, Recipe
+from users.models import CustomUser, Follow
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики избранного, рецептов и подписчиков.'
+
+    def handle(self, *args, **options):
+        counters = (
+            (Recipe, 'favorites_count', count_of(Favorite, 'recipe')),
+            (CustomUser, 'recipes_count', count_of(Recipe, 'author')),
+            (CustomUser, 'followers_count', count_of(Follow, 'author')),
+        )
+        for model, field, actual in counters:
+            drifted = model.objects.annotate(actual=actual).exclude(
+                **{field: F('actual')}
+            ).values('pk')
+            fixed = model.objects.filter(pk__in=drifted).update(
+                **{field: actual}
+            )
+            self.stdout.write(
+                f'{model.__name__}.{field}: исправлено записей - {fixed}'
+            )
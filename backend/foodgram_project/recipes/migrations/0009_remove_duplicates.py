@@ -0,0 +1,32 @@
+from django.db import migrations
+from django.db.models import Count, Min
+
+UNIQUE_FIELDS = {
+    'Favorite': ('user', 'recipe'),
+    'ShoppingCart': ('user', 'recipe'),
+    'TagsOnRecipe': ('recipe', 'tag'),
+}
+
+
+def remove_duplicates(apps, schema_editor):
+    """Оставляет по одной записи на каждую будущую уникальную пару."""
+    for model_name, fields in UNIQUE_FIELDS.items():
+        model = apps.get_model('recipes', model_name)
+        duplicates = model.objects.order_by().values(*fields).annotate(
+            keep_id=Min('id'), rows=Count('id')
+        ).filter(rows__gt=1)
+        for row in duplicates.iterator():
+            model.objects.filter(
+                **{field: row[field] for field in fields}
+            ).exclude(id=row['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_alter_ingredientsperrecipe_unique_together'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0009_remove_duplicates'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='favorite',
+            unique_together={('user', 'recipe')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='shoppingcart',
+            unique_together={('user', 'recipe')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='tagsonrecipe',
+            unique_together={('recipe', 'tag')},
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-pub_date', '-id'], name='recipe_pub_date_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:55
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_of(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            total=Count('id')
+        ).values('total')
+    ), 0)
+
+
+def fill_counters(apps, schema_editor):
+    recipe = apps.get_model('recipes', 'Recipe')
+    favorite = apps.get_model('recipes', 'Favorite')
+    user = apps.get_model('users', 'CustomUser')
+    follow = apps.get_model('users', 'Follow')
+    recipe.objects.update(favorites_count=count_of(favorite, 'recipe'))
+    user.objects.update(
+        recipes_count=count_of(recipe, 'author'),
+        followers_count=count_of(follow, 'author'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_auto_20261018_1854'),
+        ('users', '0007_auto_20261018_1855'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Добавлений в избранное'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
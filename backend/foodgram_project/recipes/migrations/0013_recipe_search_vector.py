@@ -0,0 +1,50 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:59
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+POSTGRES_FORWARD = (
+    "UPDATE recipes_recipe SET search_vector = "
+    "setweight(to_tsvector('russian', name), 'A') || "
+    "setweight(to_tsvector('russian', text), 'B')",
+    'CREATE INDEX recipe_search_vector_idx '
+    'ON recipes_recipe USING gin (search_vector)',
+)
+POSTGRES_BACKWARD = (
+    'DROP INDEX IF EXISTS recipe_search_vector_idx',
+)
+SQLITE_FORWARD = (
+    'CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5(name, text)',
+    'INSERT INTO recipes_recipe_fts (rowid, name, text) '
+    'SELECT id, name, text FROM recipes_recipe',
+)
+SQLITE_BACKWARD = (
+    'DROP TABLE IF EXISTS recipes_recipe_fts',
+)
+
+
+def run_for_vendor(postgres, sqlite):
+    def operation(apps, schema_editor):
+        statements = {'postgresql': postgres, 'sqlite': sqlite}
+        for sql in statements.get(schema_editor.connection.vendor, ()):
+            schema_editor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_ingredient_name_trgm'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(
+            run_for_vendor(POSTGRES_FORWARD, SQLITE_FORWARD),
+            run_for_vendor(POSTGRES_BACKWARD, SQLITE_BACKWARD),
+        ),
+    ]
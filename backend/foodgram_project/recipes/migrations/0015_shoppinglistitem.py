@@ -0,0 +1,48 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Sum
+
+
+def fill_shopping_lists(apps, schema_editor):
+    item = apps.get_model('recipes', 'ShoppingListItem')
+    per_recipe = apps.get_model('recipes', 'IngredientsPerRecipe')
+    totals = per_recipe.objects.filter(
+        recipe__shoppingcart__isnull=False, ingredient__isnull=False
+    ).values(
+        'recipe__shoppingcart__user_id', 'ingredient_id'
+    ).annotate(total=Sum('amount')).order_by()
+    item.objects.bulk_create((
+        item(
+            user_id=row['recipe__shoppingcart__user_id'],
+            ingredient_id=row['ingredient_id'],
+            amount=row['total'],
+        ) for row in totals.iterator()
+    ), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0014_recipe_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='recipes.Ingredient')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ('user', 'ingredient'),
+                'unique_together': {('user', 'ingredient')},
+            },
+        ),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS recipe_name_trgm_idx '
+            'ON recipes_recipe USING gin (name gin_trgm_ops)'
+        )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS recipe_name_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_recipe_image_width'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
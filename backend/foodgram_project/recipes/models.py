@@ -1,4 +1,5 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 
@@ -45,6 +46,9 @@ class Recipe(models.Model):
         'Картинка',
         upload_to='images'
     )
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки', null=True, editable=False
+    )
     cooking_time = models.PositiveIntegerField(
         'Время готовки', validators=[
             MinValueValidator(MIN_VALUE),
@@ -57,13 +61,23 @@ class Recipe(models.Model):
     )
     is_favorited = models.BooleanField('Есть в избранном', null=True)
     is_in_shopping_cart = models.BooleanField('Есть в корзине', null=True)
+    favorites_count = models.PositiveIntegerField(
+        'Добавлений в избранное', default=0
+    )
     pub_date = models.DateTimeField(
         'Дата публикации рецепта',
         auto_now_add=True,
     )
+    updated_at = models.DateTimeField('Дата изменения рецепта', auto_now=True)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         ordering = ('-pub_date', )
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'), name='recipe_pub_date_idx'
+            ),
+        )
 
     def __str__(self):
         return self.name
@@ -99,6 +113,7 @@ class TagsOnRecipe(models.Model):
 
     class Meta:
         ordering = ('recipe', 'tag', )
+        unique_together = ('recipe', 'tag', )
 
     def __str__(self):
         return f'{self.recipe} - {self.tag}'
@@ -111,6 +126,7 @@ class Favorite(models.Model):
 
     class Meta:
         ordering = ('user', 'recipe', )
+        unique_together = ('user', 'recipe', )
 
     def __str__(self):
         return f'{self.recipe} - {self.user}'
@@ -123,6 +139,23 @@ class ShoppingCart(models.Model):
 
     class Meta:
         ordering = ('user', 'recipe', )
+        unique_together = ('user', 'recipe', )
 
     def __str__(self):
         return f'{self.recipe} - {self.user}'
+
+
+class ShoppingListItem(models.Model):
+    """Сумма ингредиента по всем рецептам из корзины пользователя."""
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='shopping_list'
+    )
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE)
+    amount = models.PositiveIntegerField('Количество')
+
+    class Meta:
+        ordering = ('user', 'ingredient', )
+        unique_together = ('user', 'ingredient', )
+
+    def __str__(self):
+        return f'{self.user} - {self.ingredient}'
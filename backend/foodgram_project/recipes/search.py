@@ -0,0 +1,281 @@
+import re
+import threading
+from bisect import bisect_left
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+from heapq import nsmallest
+
+from django.conf import settings
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, TrigramSimilarity)
+from django.db import connection, transaction
+from django.db.models import BooleanField, F, FloatField, Func, Value
+from django.db.models.expressions import RawSQL
+
+from api.caching import content_version_key, get_version
+from recipes.models import Ingredient, Recipe
+
+PREFIX_END = '\U0010ffff'
+WORD_RE = re.compile(r'[^\W_]+')
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+SIMILARITY_FUNCTION = 'trigram_similarity'
+
+IndexState = namedtuple(
+    'IndexState', ('version', 'keys', 'items', 'postings', 'sizes')
+)
+
+
+def trigrams(value):
+    """Множество триграмм строки, посчитанных так же, как в pg_trgm."""
+    grams = set()
+    for word in WORD_RE.findall(value.casefold()):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(word) + 1))
+    return grams
+
+
+def trigram_similarity(value, query):
+    """Сходство двух строк по триграммам, как similarity() в pg_trgm."""
+    if value is None or query is None:
+        return None
+    value, query = trigrams(value), trigrams(query)
+    if not value or not query:
+        return 0.0
+    common = len(value & query)
+    return common / (len(value) + len(query) - common)
+
+
+def setup_connection(connection):
+    """Регистрирует в новом соединении SQLite функцию trigram_similarity."""
+    if connection.vendor == 'sqlite':
+        connection.connection.create_function(
+            SIMILARITY_FUNCTION, 2, trigram_similarity
+        )
+
+
+@contextmanager
+def similarity_threshold(threshold):
+    """Порог оператора % pg_trgm на время одной транзакции.
+
+    Оператор отбирает строки по GIN-индексу, но сравнивает с
+    pg_trgm.similarity_threshold, а не с порогом из настроек.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT set_config(%s, %s, true)',
+            ['pg_trgm.similarity_threshold', str(threshold)]
+        )
+        yield
+
+
+class IngredientIndex:
+    """Индекс названий ингредиентов в памяти процесса.
+
+    Отсортированный список названий строится из таблицы Ingredient при
+    первом поиске и перестраивается, когда меняется общая для всех
+    процессов версия кэша ингредиентов.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+
+    def _build(self, version):
+        entries = sorted(
+            (name.casefold(), pk, {
+                'id': pk, 'name': name, 'measurement_unit': unit
+            })
+            for pk, name, unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            ).iterator()
+        )
+        keys = [entry[0] for entry in entries]
+        postings = {}
+        sizes = []
+        for position, key in enumerate(keys):
+            grams = trigrams(key)
+            sizes.append(len(grams))
+            for gram in grams:
+                postings.setdefault(gram, []).append(position)
+        return IndexState(
+            version, keys, [entry[2] for entry in entries], postings, sizes
+        )
+
+    def _get_state(self):
+        version = get_version(content_version_key('ingredients'))
+        state = self._state
+        if state is None or state.version != version:
+            with self._lock:
+                if self._state is state:
+                    self._state = self._build(version)
+                state = self._state
+        return state
+
+    def _substring_candidates(self, state, query):
+        """Позиции названий, где может встретиться подстрока query.
+
+        Каждая тройка букв запроса есть в триграммах подходящего названия,
+        поэтому кандидаты - пересечение их списков. Для запросов короче
+        трёх букв остаются все названия.
+        """
+        grams = {
+            query[i:i + 3] for i in range(len(query) - 2)
+            if WORD_RE.fullmatch(query[i:i + 3])
+        }
+        if not grams:
+            return range(len(state.keys))
+        postings = sorted(
+            (state.postings.get(gram, ()) for gram in grams), key=len
+        )
+        candidates = set(postings[0])
+        for positions in postings[1:]:
+            candidates.intersection_update(positions)
+        return sorted(candidates)
+
+    def search(self, query, limit=None):
+        """Ищет ингредиенты: точное совпадение, префикс, подстрока."""
+        query = query.strip().casefold()
+        limit = limit or settings.INGREDIENT_SEARCH_LIMIT
+        state = self._get_state()
+        keys, items = state.keys, state.items
+        start = bisect_left(keys, query)
+        end = bisect_left(keys, query + PREFIX_END, start)
+        exact = []
+        prefix = []
+        for position in range(start, end):
+            if keys[position] == query:
+                exact.append(items[position])
+            elif len(exact) + len(prefix) < limit:
+                prefix.append(items[position])
+        results = (exact + prefix)[:limit]
+        if len(results) < limit:
+            for position in self._substring_candidates(state, query):
+                key = keys[position]
+                if query in key and not key.startswith(query):
+                    results.append(items[position])
+                    if len(results) == limit:
+                        break
+        return results
+
+    def fuzzy_search(self, query, limit, threshold):
+        """Ищет ингредиенты по сходству триграмм, как оператор % pg_trgm."""
+        grams = trigrams(query)
+        if not grams:
+            return []
+        state = self._get_state()
+        shared = Counter()
+        for gram in grams:
+            shared.update(state.postings.get(gram, ()))
+        ranked = []
+        for position, common in shared.items():
+            similarity = common / (len(grams) + state.sizes[position] - common)
+            if similarity >= threshold:
+                ranked.append((-similarity, state.keys[position], position))
+        return [
+            state.items[position]
+            for _, _, position in nsmallest(limit, ranked)
+        ]
+
+
+ingredient_index = IngredientIndex()
+
+
+def fuzzy_search(query, limit=None):
+    """Нечёткий поиск ингредиентов с учётом опечаток.
+
+    На PostgreSQL используется pg_trgm и GIN-индекс по названию, на
+    остальных базах - триграммный индекс в памяти процесса.
+    """
+    limit = limit or settings.INGREDIENT_SEARCH_LIMIT
+    threshold = settings.INGREDIENT_SIMILARITY_THRESHOLD
+    if connection.vendor != 'postgresql':
+        return ingredient_index.fuzzy_search(query, limit, threshold)
+    with similarity_threshold(threshold):
+        return list(Ingredient.objects.filter(
+            name__trigram_similar=query
+        ).annotate(
+            similarity=TrigramSimilarity('name', query)
+        ).order_by(
+            '-similarity', 'name'
+        ).values('id', 'name', 'measurement_unit')[:limit])
+
+
+def update_search_index(recipe_ids):
+    """Пересчитывает поисковый индекс рецептов после их изменения."""
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    if connection.vendor == 'postgresql':
+        Recipe.objects.filter(id__in=recipe_ids).update(search_vector=(
+            SearchVector('name', weight='A', config=SEARCH_CONFIG)
+            + SearchVector('text', weight='B', config=SEARCH_CONFIG)
+        ))
+        return
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})',
+            recipe_ids
+        )
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, text) '
+            f'SELECT id, name, text FROM recipes_recipe '
+            f'WHERE id IN ({placeholders})',
+            recipe_ids
+        )
+
+
+def search_recipes(queryset, query):
+    """Отбирает рецепты по полнотекстовому запросу и сортирует по рангу.
+
+    На PostgreSQL используется хранимый search_vector с GIN-индексом, на
+    SQLite - виртуальная таблица FTS5.
+    """
+    if connection.vendor == 'postgresql':
+        search_query = SearchQuery(query, config=SEARCH_CONFIG)
+        queryset = queryset.filter(search_vector=search_query).annotate(
+            search_rank=SearchRank(F('search_vector'), search_query)
+        )
+    else:
+        words = WORD_RE.findall(query)
+        if not words:
+            return queryset.none()
+        match = ' '.join(f'"{word}"*' for word in words)
+        # RawSQL в id__in дал бы IN ((SELECT ...)), а SQLite сравнивает
+        # такое выражение только с первой строкой подзапроса.
+        queryset = queryset.annotate(search_match=RawSQL(
+            f'recipes_recipe.id IN (SELECT rowid FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s)',
+            (match, ), output_field=BooleanField()
+        )).filter(search_match=True).annotate(search_rank=RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, 10.0, 1.0) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = recipes_recipe.id',
+            (match, ), output_field=FloatField()
+        ))
+    return queryset.order_by('-search_rank', '-pub_date', '-id')
+
+
+def fuzzy_search_recipes(queryset, query):
+    """Отбирает рецепты по сходству названия с запросом с учётом опечаток.
+
+    На PostgreSQL id кандидатов заранее отбирает оператор % по
+    GIN-индексу, на SQLite сходство считает функция, зарегистрированная
+    в соединении.
+    """
+    threshold = settings.RECIPE_SIMILARITY_THRESHOLD
+    if connection.vendor == 'postgresql':
+        with similarity_threshold(threshold):
+            ids = list(queryset.filter(
+                name__trigram_similar=query
+            ).order_by().values_list('id', flat=True))
+        return queryset.filter(id__in=ids).annotate(
+            search_rank=TrigramSimilarity('name', query)
+        ).order_by('-search_rank', '-pub_date', '-id')
+    similarity = Func(
+        F('name'), Value(query), function=SIMILARITY_FUNCTION,
+        output_field=FloatField()
+    )
+    return queryset.annotate(search_rank=similarity).filter(
+        search_rank__gte=threshold
+    ).order_by('-search_rank', '-pub_date', '-id')
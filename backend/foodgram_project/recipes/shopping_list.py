@@ -0,0 +1,82 @@
+from django.db import connection
+from django.db.models import F, OuterRef, Subquery
+
+from recipes.models import IngredientsPerRecipe, ShoppingCart, ShoppingListItem
+
+ITEMS_TABLE = ShoppingListItem._meta.db_table
+UPSERT = (
+    f'ON CONFLICT (user_id, ingredient_id) DO UPDATE '
+    f'SET amount = {ITEMS_TABLE}.amount + excluded.amount'
+)
+
+
+def add_recipe(user_id, recipe_id):
+    """Прибавляет ингредиенты рецепта к списку покупок одним upsert."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {ITEMS_TABLE} (user_id, ingredient_id, amount) '
+            f'SELECT %s, ingredient_id, amount '
+            f'FROM {IngredientsPerRecipe._meta.db_table} '
+            f'WHERE recipe_id = %s AND ingredient_id IS NOT NULL {UPSERT}',
+            (user_id, recipe_id)
+        )
+
+
+def remove_recipe(user_id, recipe_id):
+    """Вычитает ингредиенты рецепта из списка покупок."""
+    per_recipe = IngredientsPerRecipe.objects.filter(recipe_id=recipe_id)
+    ShoppingListItem.objects.filter(
+        user_id=user_id,
+        ingredient_id__in=per_recipe.values('ingredient_id')
+    ).update(amount=F('amount') - Subquery(per_recipe.filter(
+        ingredient_id=OuterRef('ingredient_id')
+    ).values('amount')[:1]))
+    ShoppingListItem.objects.filter(user_id=user_id, amount__lte=0).delete()
+
+
+def change_amounts(recipe_id, changes):
+    """Переносит изменения ингредиентов рецепта во все корзины с ним.
+
+    changes - словарь {ingredient_id: изменение количества}.
+    """
+    added = [
+        (ingredient_id, amount, recipe_id)
+        for ingredient_id, amount in changes.items() if amount > 0
+    ]
+    if added:
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {ITEMS_TABLE} (user_id, ingredient_id, amount) '
+                f'SELECT user_id, %s, %s '
+                f'FROM {ShoppingCart._meta.db_table} '
+                f'WHERE recipe_id = %s {UPSERT}',
+                added
+            )
+    users = ShoppingCart.objects.filter(recipe_id=recipe_id).values('user_id')
+    removed = False
+    for ingredient_id, amount in changes.items():
+        if amount < 0:
+            ShoppingListItem.objects.filter(
+                user_id__in=users, ingredient_id=ingredient_id
+            ).update(amount=F('amount') + amount)
+            removed = True
+    if removed:
+        ShoppingListItem.objects.filter(
+            user_id__in=users, amount__lte=0
+        ).delete()
+
+
+def rebuild(user_id):
+    """Собирает список покупок пользователя заново по его корзине."""
+    ShoppingListItem.objects.filter(user_id=user_id).delete()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {ITEMS_TABLE} (user_id, ingredient_id, amount) '
+            f'SELECT cart.user_id, item.ingredient_id, SUM(item.amount) '
+            f'FROM {IngredientsPerRecipe._meta.db_table} item '
+            f'JOIN {ShoppingCart._meta.db_table} cart '
+            f'ON cart.recipe_id = item.recipe_id '
+            f'WHERE cart.user_id = %s AND item.ingredient_id IS NOT NULL '
+            f'GROUP BY cart.user_id, item.ingredient_id',
+            (user_id, )
+        )
@@ -0,0 +1,148 @@
+from django.db.backends.signals import connection_created
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from recipes.models import (Favorite, IngredientsPerRecipe, Recipe,
+                            ShoppingCart, TagsOnRecipe)
+from recipes.search import setup_connection, update_search_index
+from recipes.shopping_list import add_recipe, change_amounts, remove_recipe
+from recipes.tasks import schedule_image_variants
+from users.models import CustomUser
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    setup_connection(connection)
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_added(sender, instance, created, **kwargs):
+    if created:
+        Recipe.objects.filter(id=instance.recipe_id).update(
+            favorites_count=F('favorites_count') + 1
+        )
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_removed(sender, instance, **kwargs):
+    Recipe.objects.filter(id=instance.recipe_id).update(
+        favorites_count=Greatest(F('favorites_count') - 1, 0)
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_added(sender, instance, created, **kwargs):
+    if created:
+        CustomUser.objects.filter(id=instance.author_id).update(
+            recipes_count=F('recipes_count') + 1
+        )
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_removed(sender, instance, **kwargs):
+    CustomUser.objects.filter(id=instance.author_id).update(
+        recipes_count=Greatest(F('recipes_count') - 1, 0)
+    )
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    update_search_index([instance.id])
+
+
+def touch_recipes(*recipe_ids):
+    Recipe.objects.filter(id__in=recipe_ids).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=IngredientsPerRecipe)
+@receiver(post_delete, sender=IngredientsPerRecipe)
+@receiver(post_save, sender=TagsOnRecipe)
+@receiver(post_delete, sender=TagsOnRecipe)
+def recipe_relation_changed(sender, instance, **kwargs):
+    touch_recipes(instance.recipe_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        touch_recipes(*(pk_set or ()))
+    else:
+        touch_recipes(instance.id)
+
+
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def shopping_cart_changed(sender, instance, **kwargs):
+    CustomUser.objects.filter(id=instance.user_id).update(
+        cart_updated_at=timezone.now()
+    )
+
+
+@receiver(post_save, sender=ShoppingCart)
+def recipe_added_to_cart(sender, instance, created, **kwargs):
+    if created:
+        add_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def recipe_removed_from_cart(sender, instance, **kwargs):
+    remove_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(pre_save, sender=IngredientsPerRecipe)
+def ingredient_amount_saving(sender, instance, **kwargs):
+    instance.saved_amount = IngredientsPerRecipe.objects.filter(
+        pk=instance.pk
+    ).values_list('ingredient_id', 'amount').first() if instance.pk else None
+
+
+@receiver(post_save, sender=IngredientsPerRecipe)
+def ingredient_amount_saved(sender, instance, **kwargs):
+    changes = {}
+    if instance.saved_amount:
+        ingredient_id, amount = instance.saved_amount
+        changes[ingredient_id] = -amount
+    if instance.ingredient_id:
+        changes[instance.ingredient_id] = (
+            changes.get(instance.ingredient_id, 0) + instance.amount
+        )
+    changes.pop(None, None)
+    change_amounts(instance.recipe_id, changes)
+
+
+@receiver(post_delete, sender=IngredientsPerRecipe)
+def ingredient_amount_removed(sender, instance, **kwargs):
+    if instance.ingredient_id:
+        change_amounts(
+            instance.recipe_id, {instance.ingredient_id: -instance.amount}
+        )
+
+
+@receiver(pre_save, sender=Recipe)
+def recipe_image_saving(sender, instance, **kwargs):
+    # Имя нового файла известно только после сохранения: одинаковое
+    # содержимое получает то же имя, и копии не пересоздаются.
+    instance.saved_image = Recipe.objects.filter(
+        pk=instance.pk
+    ).values_list('image', flat=True).first() if instance.pk else None
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_saved(sender, instance, **kwargs):
+    if instance.image and instance.image.name != instance.saved_image:
+        instance.saved_image = instance.image.name
+        width = instance.image_width
+        schedule_image_variants([instance])
+        # update, а не save: повторный save снова вызвал бы все
+        # обработчики post_save рецепта.
+        if instance.image_width != width:
+            Recipe.objects.filter(pk=instance.pk).update(
+                image_width=instance.image_width
+            )
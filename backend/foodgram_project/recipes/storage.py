@@ -0,0 +1,79 @@
+import hashlib
+import os
+import posixpath
+from collections import Counter
+from uuid import uuid4
+
+from django.apps import apps
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import models
+
+PARTIAL_SUFFIX = '.part-'
+
+
+def file_fields():
+    """Пары (модель, имя поля) для всех FileField проекта."""
+    for model in apps.get_models():
+        for field in model._meta.concrete_fields:
+            if isinstance(field, models.FileField):
+                yield model, field.name
+
+
+class ContentHashStorage(FileSystemStorage):
+    """Хранилище, в котором имя файла - SHA-256 его содержимого.
+
+    Одинаковые файлы хранятся один раз: если файл с таким хешем уже
+    есть, запись пропускается. Новый файл пишется во временный файл
+    рядом и атомарно переименовывается, поэтому одновременная загрузка
+    одной и той же картинки безопасна. У найденного дубликата
+    обновляется время изменения, чтобы collect_media_garbage не удалил
+    его как старый файл без ссылок, пока новая запись не сохранена.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        try:
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            return self.save_as(name, content)
+        return name
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        directory = posixpath.dirname(name)
+        extension = posixpath.splitext(name)[1].lower()
+        digest = digest.hexdigest()
+        return posixpath.join(directory, digest[:2], digest + extension)
+
+    def save_as(self, name, content):
+        """Атомарно записывает файл под именем name без хеширования."""
+        partial = self._save(f'{name}{PARTIAL_SUFFIX}{uuid4().hex}', content)
+        os.replace(self.path(partial), self.path(name))
+        return name
+
+    def references(self, name):
+        """Число записей в базе, которые ссылаются на файл."""
+        return sum(
+            model._default_manager.filter(**{field: name}).count()
+            for model, field in file_fields()
+        )
+
+
+def reference_counts():
+    """Число ссылок из базы на каждый файл."""
+    counts = Counter()
+    for model, field in file_fields():
+        counts.update(
+            model._default_manager.exclude(**{field: ''}).values_list(
+                field, flat=True
+            ).iterator()
+        )
+    return counts
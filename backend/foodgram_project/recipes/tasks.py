@@ -0,0 +1,35 @@
+from jobs.queue import enqueue_jobs, make_job, task
+from recipes.images import ensure_variants, known_widths
+from recipes.models import Recipe
+
+VARIANTS_PRIORITY = 10
+
+
+@task
+def generate_image_variants(recipe_id):
+    """Создаёт WebP-копии картинки рецепта и сохраняет её ширину."""
+    recipe = Recipe.objects.filter(id=recipe_id).exclude(image='').first()
+    if recipe is None:
+        return
+    ensure_variants([recipe])
+    if Recipe.objects.filter(id=recipe.id, image=recipe.image.name).exists():
+        # updated_at меняет ETag рецепта.
+        recipe.save(update_fields=['image_width', 'updated_at'])
+
+
+def schedule_image_variants(recipes):
+    """Ставит image_width уже обработанных файлов, для новых - задачу.
+
+    Пока задача не выполнена, image_width пуст и srcset не отдаётся.
+    """
+    widths = known_widths(recipes)
+    jobs = []
+    for recipe in recipes:
+        recipe.image_width = widths.get(recipe.image.name)
+        if recipe.image_width is None:
+            jobs.append(make_job(
+                generate_image_variants, [recipe.id],
+                priority=VARIANTS_PRIORITY,
+                dedupe_key=f'recipe-image:{recipe.id}'
+            ))
+    enqueue_jobs(jobs)
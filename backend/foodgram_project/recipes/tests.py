@@ -0,0 +1,246 @@
+import io
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models.signals import post_save
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from recipes.models import (Favorite, Ingredient, IngredientsPerRecipe, Recipe,
+                            ShoppingCart, ShoppingListItem)
+from recipes.search import IngredientIndex
+from recipes.shopping_list import rebuild
+from recipes.storage import ContentHashStorage
+from users.models import CustomUser, Follow
+
+USERS = 50
+RECIPES = 400
+
+
+class QueryPlanTests(TestCase):
+    """Частые выборки на заполненной базе идут по индексам."""
+
+    @classmethod
+    def setUpTestData(cls):
+        CustomUser.objects.bulk_create(
+            CustomUser(
+                email=f'user{i}@example.com', username=f'user{i}',
+                first_name='Имя', last_name='Фамилия'
+            ) for i in range(USERS)
+        )
+        # SQLite не возвращает id из bulk_create, поэтому строки
+        # перечитываются.
+        users = list(CustomUser.objects.order_by('id'))
+        now = timezone.now()
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=users[i % USERS], name=f'Рецепт {i}', text='Текст',
+                image='images/recipe.png', cooking_time=10,
+                pub_date=now - timedelta(minutes=i)
+            ) for i in range(RECIPES)
+        )
+        recipes = list(Recipe.objects.order_by('id'))
+        for model in (Favorite, ShoppingCart):
+            model.objects.bulk_create(
+                model(user=user, recipe=recipe)
+                for number, user in enumerate(users)
+                for recipe in recipes[number::7]
+            )
+        Follow.objects.bulk_create(
+            Follow(user=user, author=author)
+            for number, user in enumerate(users)
+            for author in users[number + 1::3]
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        cls.user = users[0]
+        cls.author = users[1]
+        cls.recipe = recipes[0]
+
+    def assert_uses_index(self, queryset):
+        plan = queryset.explain()
+        if connection.vendor == 'postgresql':
+            self.assertIn('Index', plan)
+            self.assertNotIn('Seq Scan', plan)
+        else:
+            self.assertIn('USING', plan)
+            self.assertIn('INDEX', plan)
+
+    # Проверки существования и выборки id идут без сортировки из Meta,
+    # которая добавляет соединения с пользователями и рецептами.
+    def test_user_recipe_lookups(self):
+        for model in (Favorite, ShoppingCart):
+            with self.subTest(model=model.__name__):
+                self.assert_uses_index(model.objects.filter(
+                    user=self.user, recipe=self.recipe
+                ).order_by())
+                self.assert_uses_index(model.objects.filter(
+                    user=self.user
+                ).order_by().values('recipe_id'))
+
+    def test_user_author_lookup(self):
+        self.assert_uses_index(Follow.objects.filter(
+            user=self.user, author=self.author
+        ).order_by())
+        self.assert_uses_index(Follow.objects.filter(
+            user=self.user
+        ).order_by().values('author_id'))
+
+    def test_feed_ordering(self):
+        self.assert_uses_index(
+            Recipe.objects.order_by('-pub_date', '-id')[:6]
+        )
+
+
+class ContentHashStorageTests(TestCase):
+    """Хранилище по хешу и сборщик мусора в MEDIA_ROOT."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.storage = ContentHashStorage(location=self.media_root)
+
+    def collect_garbage(self):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            call_command(
+                'collect_media_garbage', skip_checks=False,
+                stdout=io.StringIO()
+            )
+
+    def test_duplicate_refreshes_mtime(self):
+        name = self.storage.save('images/a.png', ContentFile(b'image'))
+        path = self.storage.path(name)
+        os.utime(path, (0, 0))
+        self.assertEqual(
+            self.storage.save('images/b.png', ContentFile(b'image')), name
+        )
+        self.assertGreater(os.stat(path).st_mtime, 0)
+        self.collect_garbage()
+        self.assertTrue(os.path.exists(path))
+
+    def test_old_orphan_removed(self):
+        name = self.storage.save('images/a.png', ContentFile(b'image'))
+        path = self.storage.path(name)
+        os.utime(path, (0, 0))
+        self.collect_garbage()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(os.path.dirname(path)))
+
+
+class IngredientIndexTests(TransactionTestCase):
+    """Индекс ингредиентов следует за общей версией кэша."""
+
+    def names(self, index, query):
+        return [item['name'] for item in index.search(query)]
+
+    def test_rebuilt_after_change_elsewhere(self):
+        index = IngredientIndex()
+        Ingredient.objects.create(name='мука', measurement_unit='г')
+        self.assertEqual(self.names(index, 'мук'), ['мука'])
+        # Запись, изменённая без сигналов этого индекса, как в другом
+        # процессе: версия в базе всё равно меняется.
+        Ingredient.objects.create(name='мускат', measurement_unit='г')
+        self.assertEqual(self.names(index, 'му'), ['мука', 'мускат'])
+
+    def test_substring(self):
+        index = IngredientIndex()
+        for name in ('мука пшеничная', 'кукурузная мука', 'сахар', 'ук'):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+        self.assertEqual(
+            self.names(index, 'мука'), ['мука пшеничная', 'кукурузная мука']
+        )
+        self.assertEqual(self.names(index, 'уку'), ['кукурузная мука'])
+        self.assertEqual(
+            self.names(index, 'ук'),
+            ['ук', 'кукурузная мука', 'мука пшеничная']
+        )
+
+
+class RecipeImageSignalTests(TestCase):
+    """Ширина картинки ставится без повторного сохранения рецепта."""
+
+    def setUp(self):
+        self.author = CustomUser.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Имя', last_name='Фамилия'
+        )
+        self.saved = []
+        post_save.connect(self.recipe_saved, sender=Recipe)
+        self.addCleanup(
+            post_save.disconnect, self.recipe_saved, sender=Recipe
+        )
+
+    def recipe_saved(self, sender, instance, **kwargs):
+        self.saved.append(instance.id)
+
+    def create_recipe(self):
+        return Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Текст',
+            image='images/recipe.png', cooking_time=10
+        )
+
+    def test_saved_once(self):
+        Recipe.objects.filter(id=self.create_recipe().id).update(
+            image_width=640
+        )
+        recipe = self.create_recipe()
+        self.assertEqual(self.saved.count(recipe.id), 1)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image_width, 640)
+
+
+class ShoppingListTests(TestCase):
+    """Список покупок меняется вместе с корзиной без пересборки."""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='user@example.com', username='user',
+            first_name='Имя', last_name='Фамилия'
+        )
+        self.flour = Ingredient.objects.create(
+            name='мука', measurement_unit='г'
+        )
+        self.sugar = Ingredient.objects.create(
+            name='сахар', measurement_unit='г'
+        )
+        self.bread = self.create_recipe({self.flour: 500})
+        self.cake = self.create_recipe({self.flour: 200, self.sugar: 100})
+
+    def create_recipe(self, amounts):
+        recipe = Recipe.objects.create(
+            author=self.user, name='Рецепт', text='Текст',
+            image='images/recipe.png', cooking_time=10
+        )
+        IngredientsPerRecipe.objects.bulk_create(
+            IngredientsPerRecipe(
+                recipe=recipe, ingredient=ingredient, amount=amount
+            ) for ingredient, amount in amounts.items()
+        )
+        return recipe
+
+    def shopping_list(self):
+        return dict(ShoppingListItem.objects.filter(
+            user=self.user
+        ).values_list('ingredient__name', 'amount'))
+
+    def test_add_and_remove(self):
+        ShoppingCart.objects.create(user=self.user, recipe=self.bread)
+        self.assertEqual(self.shopping_list(), {'мука': 500})
+        ShoppingCart.objects.create(user=self.user, recipe=self.cake)
+        self.assertEqual(self.shopping_list(), {'мука': 700, 'сахар': 100})
+        ShoppingCart.objects.get(user=self.user, recipe=self.bread).delete()
+        self.assertEqual(self.shopping_list(), {'мука': 200, 'сахар': 100})
+        ShoppingCart.objects.get(user=self.user, recipe=self.cake).delete()
+        self.assertEqual(self.shopping_list(), {})
+
+    def test_matches_rebuild(self):
+        for recipe in (self.bread, self.cake):
+            ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        expected = self.shopping_list()
+        rebuild(self.user.id)
+        self.assertEqual(self.shopping_list(), expected)
@@ -7,5 +7,7 @@ admin.site.register(Follow)
 
 @admin.register(CustomUser)
 class UserAdmin(admin.ModelAdmin):
-    list_display = ('username', 'email', 'first_name', 'last_name')
+    list_display = ('username', 'email', 'first_name', 'last_name',
+                    'recipes_count', 'followers_count')
+    readonly_fields = ('recipes_count', 'followers_count')
     list_filter = ('username', 'email')
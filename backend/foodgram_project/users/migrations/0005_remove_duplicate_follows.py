@@ -0,0 +1,25 @@
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def remove_duplicates(apps, schema_editor):
+    """Оставляет по одной подписке на каждую пару пользователь-автор."""
+    follow = apps.get_model('users', 'Follow')
+    duplicates = follow.objects.order_by().values('user', 'author').annotate(
+        keep_id=Min('id'), rows=Count('id')
+    ).filter(rows__gt=1)
+    for row in duplicates.iterator():
+        follow.objects.filter(
+            user=row['user'], author=row['author']
+        ).exclude(id=row['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_alter_follow_options'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:54
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_remove_duplicate_follows'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='follow',
+            unique_together={('user', 'author')},
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_auto_20261018_1855'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='cart_updated_at',
+            field=models.DateTimeField(editable=False, null=True, verbose_name='Дата изменения корзины'),
+        ),
+    ]
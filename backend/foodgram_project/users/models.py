@@ -30,6 +30,15 @@ class UserManager(BaseUserManager):
 class CustomUser(AbstractUser):
     "Кастомная модель пользователя."
     is_subscribed = models.BooleanField(null=True)
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов', default=0
+    )
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков', default=0
+    )
+    cart_updated_at = models.DateTimeField(
+        'Дата изменения корзины', null=True, editable=False
+    )
 
     objects = UserManager()
 
@@ -70,6 +79,7 @@ class Follow(models.Model):
     class Meta:
         verbose_name = 'Подписки'
         ordering = ('user', 'author', )
+        unique_together = ('user', 'author', )
 
     def __str__(self):
         return f'{self.user} follows {self.author}'
@@ -1,7 +1,10 @@
+from django.shortcuts import get_object_or_404
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
-from api.common import Base64ImageField
+from api.common import Base64ImageField, ImageSrcsetField
+from api.idempotency import create_once
+from api.relations import context_relations
 from recipes.models import Recipe
 from users.models import CustomUser, Follow
 
@@ -17,17 +20,7 @@ class AuthorSerializer(serializers.ModelSerializer):
         extra_kwargs = {'password': {'write_only': True}}
 
     def get_is_subscribed(self, obj):
-        if (
-            self.context[
-                'request_user'
-            ] and self.context['request_user'].is_authenticated
-        ):
-            user = self.context['request_user']
-        else:
-            return False
-        if obj != user:
-            return Follow.objects.filter(user=user, author=obj).exists()
-        return False
+        return obj.id in context_relations(self.context).following
 
 
 class SignUpSerializer(serializers.ModelSerializer):
@@ -70,19 +63,19 @@ class SetPasswordSerializer(serializers.Serializer):
 class LimitListSerializer(serializers.ListSerializer):
 
     def to_representation(self, data):
-        data = super().to_representation(data)
         if self.context.get('recipes_limit'):
             limit = int(self.context.get('recipes_limit'))
-            data = data[:limit]
-        return data
+            data = data.all()[:limit]
+        return super().to_representation(data)
 
 
 class SimpleRecipeSerializer(serializers.ModelSerializer):
     """Сериализатор рецепта для подписок, избранного и корзины."""
     image = Base64ImageField()
+    image_srcset = ImageSrcsetField()
 
     class Meta:
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_srcset', 'cooking_time')
         model = Recipe
         list_serializer_class = LimitListSerializer
 
@@ -99,28 +92,13 @@ class FollowSerializer(serializers.ModelSerializer):
                   'last_name', 'is_subscribed', 'recipes', 'recipes_count')
         read_only_fields = ('username', )
 
-    def to_representation(self, instance):
-        ret = super().to_representation(instance)
-        try:
-            ret['recipes_count'] = self.fields[
-                'recipes_count'
-            ].to_representation(instance.recipes_count)
-        except:
-            ret['recipes_count'] = self.fields[
-                'recipes_count'
-            ].to_representation(instance.recipes.count())
-        return ret
-
     def get_is_subscribed(self, obj):
-        user = self.context['request_user']
-        if obj != user:
-            return Follow.objects.filter(user=user, author=obj).exists()
-        return False
+        return obj.id in context_relations(self.context).following
 
     def save(self, **kwargs):
         user_id = kwargs.get('user_id')
-        self.instance = CustomUser.objects.get(id=user_id)
-        Follow.objects.get_or_create(
-            author_id=user_id, user=self.context['request_user']
+        self.instance = get_object_or_404(CustomUser, id=user_id)
+        create_once(
+            Follow, author_id=user_id, user=self.context['request_user']
         )
         return self.instance
@@ -0,0 +1,21 @@
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from users.models import CustomUser, Follow
+
+
+@receiver(post_save, sender=Follow)
+def follow_added(sender, instance, created, **kwargs):
+    if created:
+        CustomUser.objects.filter(id=instance.author_id).update(
+            followers_count=F('followers_count') + 1
+        )
+
+
+@receiver(post_delete, sender=Follow)
+def follow_removed(sender, instance, **kwargs):
+    CustomUser.objects.filter(id=instance.author_id).update(
+        followers_count=Greatest(F('followers_count') - 1, 0)
+    )
@@ -1,15 +1,18 @@
-from django.db.models import Count
+from django.db.models import OuterRef, Prefetch, Subquery
 from django.http import HttpResponseBadRequest
 from django.shortcuts import get_object_or_404
 from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action, api_view, permission_classes
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import (BasePagination, CursorPagination,
+                                       PageNumberPagination)
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework_simplejwt.token_blacklist.models import (BlacklistedToken,
                                                              OutstandingToken)
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from api.idempotency import delete_once, idempotent
+from recipes.models import Recipe
 from users.models import CustomUser, Follow
 from users.serializers import (AuthorSerializer, FollowSerializer,
                                ObtainTokenSerializer, SetPasswordSerializer,
@@ -63,7 +66,7 @@ class UserViewSet(mixins.CreateModelMixin, mixins.ListModelMixin,
         ):
             return HttpResponseBadRequest('Неверный пароль.')
         user.set_password(serializer.validated_data['new_password'])
-        user.save()
+        user.save(update_fields=['password'])
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -99,17 +102,56 @@ class LimitPageNumberPagination(PageNumberPagination):
     page_size_query_param = 'limit'
 
 
+class LimitCursorPagination(CursorPagination):
+    """Пагинация по курсору без COUNT(*) и OFFSET."""
+    page_size = 6
+    page_size_query_param = 'limit'
+    ordering = ('-pub_date', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        return getattr(view, 'cursor_ordering', self.ordering)
+
+
+class FeedPagination(BasePagination):
+    """Постраничная пагинация с переходом на курсор по ?pagination=cursor.
+
+    Курсор сортирует по своим полям, поэтому запрос с явной сортировкой,
+    например поиск по релевантности, остаётся постраничным.
+    """
+    mode_query_param = 'pagination'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (request.query_params.get(self.mode_query_param) == 'cursor'
+                and not queryset.query.order_by):
+            self.paginator = LimitCursorPagination()
+        else:
+            self.paginator = LimitPageNumberPagination()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+
 class FollowViewSet(mixins.CreateModelMixin, mixins.DestroyModelMixin,
                     mixins.ListModelMixin, viewsets.GenericViewSet):
     """Вьюсет для Подписок."""
     serializer_class = FollowSerializer
-    pagination_class = LimitPageNumberPagination
+    pagination_class = FeedPagination
+    cursor_ordering = ('username', 'id')
 
     def get_queryset(self):
         qs = self.request.user.follower.values_list('author_id', flat=True)
-        return CustomUser.objects.annotate(
-            recipes_count=Count('recipes')
-        ).filter(id__in=qs)
+        recipes = Recipe.objects.all()
+        limit = self.request.query_params.get('recipes_limit')
+        if limit and limit.isdigit():
+            recipes = recipes.filter(id__in=Subquery(
+                Recipe.objects.filter(
+                    author_id=OuterRef('author_id')
+                ).values('id')[:int(limit)]
+            ))
+        return CustomUser.objects.filter(id__in=qs).prefetch_related(
+            Prefetch('recipes', queryset=recipes)
+        )
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -122,9 +164,13 @@ class FollowViewSet(mixins.CreateModelMixin, mixins.DestroyModelMixin,
     def perform_create(self, serializer):
         serializer.save(user_id=self.kwargs.get('user_id'))
 
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
+    @idempotent
     def destroy(self, request, *args, **kwargs):
-        instance = Follow.objects.get(
-            author_id=self.kwargs['user_id'], user=request.user
+        delete_once(
+            Follow, author_id=self.kwargs['user_id'], user=request.user
         )
-        self.perform_destroy(instance)
         return Response(status=status.HTTP_204_NO_CONTENT)